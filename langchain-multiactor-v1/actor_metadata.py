@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from typing import List, Dict
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ActorMetadata:
     name: str
     data_description: str
@@ -1,21 +1,72 @@
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Union, Coroutine, TypeVar, AsyncIterator, Callable, Tuple
 from pathlib import Path
-from openai import OpenAI
+from openai import AsyncOpenAI, NotFoundError
+from registry import AssetRegistry, sha256_hex
+import httpx
+import asyncio
+import io
+import logging
+import threading
+import serialization
+import uuid
 import os
 from dotenv import load_dotenv
-import time
+
+try:
+    import h2
+except ImportError:  # h2 is optional; without it the pool speaks HTTP/1.1
+    h2 = None
 
 # Load environment variables at module level
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Responses API WebSocket transport (beta)
+RESPONSES_WS_URL = "wss://api.openai.com/v1/responses"
+RESPONSES_WS_BETA = "responses_websockets=2026-02-06"
+
+# Background event loop backing the synchronous wrappers
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Run a coroutine on the shared background event loop and wait for its result.
+
+    A single long-lived loop keeps the AsyncOpenAI connection pool valid across
+    synchronous calls, and is safe to call from several threads at once.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="orchestrator-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+def create_async_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """Create an AsyncOpenAI client backed by a pooled connection, multiplexed over HTTP/2 if h2 is installed."""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        http2=h2 is not None,
+        timeout=httpx.Timeout(60.0)
+    )
+    return AsyncOpenAI(api_key=api_key or os.getenv('OPENAI_API_KEY'), http_client=http_client)
+
 class CodeInterpreterAgent:
     """
     A LangChain agent that uses OpenAI's Assistant API with file management capabilities
     that preserve original filenames.
     """
     
-    # Initialize OpenAI client at class level
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    # Bound concurrent uploads to stay within the client's connection pool
+    _upload_semaphore = asyncio.Semaphore(8)
+    
+    # Uploaded files and assistants reused across runs
+    registry = AssetRegistry()
     
     def __init__(
         self,
@@ -25,16 +76,21 @@ class CodeInterpreterAgent:
         temperature: float = 0.7,
         tools: Optional[List[Dict[str, str]]] = None,
         files: Optional[List[str]] = None,
-        verbose: bool = True
+        verbose: bool = True,
+        use_websocket: bool = False,
+        client: Optional[AsyncOpenAI] = None
     ):
         """Initialize the CodeInterpreterAgent."""
         if not os.getenv('OPENAI_API_KEY'):
             raise ValueError("OPENAI_API_KEY not found in environment variables")
             
+        # Orchestrators inject their shared client; a standalone agent creates one on first use
+        self._client = client
         self.name = name
         self.instructions = instructions
         self.model = model
         self.temperature = temperature
+        # Output goes through logging; verbose is kept for API compatibility
         self.verbose = verbose
         
         # Set default tools if none provided
@@ -44,82 +100,150 @@ class CodeInterpreterAgent:
         self.file_mapping: Dict[str, Dict[str, str]] = {}
         self.files = files or []
         self.assistant_id = None
+        # Registry key of the assistant, so a purge can unregister it
+        self._assistant_key: Optional[str] = None
+        # Rendered file mapping text, rebuilt only when the mapping changes
+        self._file_instructions_cache: Optional[str] = None
         
-        if self.verbose:
-            print("\nInitializing with configuration:")
-            print(f"Name: {self.name}")
-            print(f"Model: {self.model}")
-            print(f"Temperature: {self.temperature}")
-            print(f"Tools: {self.tools}")
-            print(f"Number of files: {len(self.files)}")
-
-    def _upload_file(self, file_path: str) -> str:
+        # Optional persistent Responses API connection, chained per thread
+        self.use_websocket = use_websocket
+        self._ws = None
+        self._ws_lock = asyncio.Lock()
+        self._response_chain: Dict[str, str] = {}
+        
+        logger.debug(
+            "Initializing %s (model=%s, temperature=%s, tools=%s, files=%d)",
+            self.name, self.model, self.temperature, self.tools, len(self.files)
+        )
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """The agent's client, created only if none was injected by the time it is needed."""
+        if self._client is None:
+            self._client = create_async_client()
+        return self._client
+
+    @client.setter
+    def client(self, client: AsyncOpenAI) -> None:
+        self._client = client
+
+    async def _upload_file(self, file_path: str) -> str:
         """Upload a file to OpenAI and maintain filename mapping."""
-        if self.verbose:
-            print(f"\nAttempting to upload file: {file_path}")
+        logger.debug("Attempting to upload file: %s", file_path)
             
         try:
-            with open(file_path, 'rb') as file:
-                response = self.client.files.create(
-                    file=file,
-                    purpose='assistants'
-                )
+            async with self._upload_semaphore:
+                # Read off the event loop so large files don't stall other actors
+                content = await asyncio.to_thread(Path(file_path).read_bytes)
+                digest = sha256_hex(content)
+                file_id = await self._find_cached_file(digest)
                 
-                self.file_mapping[response.id] = {
-                    'filename': Path(file_path).name,
-                    'path': file_path
-                }
+                if file_id:
+                    logger.debug("Reusing uploaded %s → file ID: %s", file_path, file_id)
+                else:
+                    response = await self.client.files.create(
+                        file=(Path(file_path).name, content),
+                        purpose='assistants'
+                    )
+                    file_id = response.id
+                    self.registry.set_file(digest, file_id)
+                    logger.debug("Successfully uploaded %s → file ID: %s", file_path, file_id)
                 
-                if self.verbose:
-                    print(f"Successfully uploaded {Path(file_path).name} → file ID: {response.id}")
-                
-                return response.id
+            self.file_mapping[file_id] = {
+                'filename': Path(file_path).name,
+                'path': file_path
+            }
+            self._invalidate_instructions()
+            
+            return file_id
         except Exception as e:
-            print(f"Error uploading file {file_path}: {str(e)}")
+            logger.error("Error uploading file %s: %s", file_path, e)
             raise
 
+    async def _find_cached_file(self, digest: str) -> Optional[str]:
+        """Return a previously uploaded file ID for this content if it still exists."""
+        file_id = self.registry.get_file(digest)
+        if not file_id:
+            return None
+        try:
+            await self.client.files.retrieve(file_id)
+            return file_id
+        except NotFoundError:
+            self.registry.remove_file(file_id)
+            return None
+
+    async def _find_cached_assistant(self, key: str) -> Optional[str]:
+        """Return a previously created assistant ID for this configuration if it still exists."""
+        assistant_id = self.registry.get_assistant(key)
+        if not assistant_id:
+            return None
+        try:
+            await self.client.beta.assistants.retrieve(assistant_id)
+            return assistant_id
+        except NotFoundError:
+            self.registry.remove_assistant(key)
+            return None
+
+    def _invalidate_instructions(self) -> None:
+        """Drop the rendered file mapping after it changes."""
+        self._file_instructions_cache = None
+
+    def _file_mapping_messages(self, role: str = "user") -> List[Dict[str, str]]:
+        """Messages that introduce the file mapping once at the start of a conversation."""
+        file_instructions = self._create_file_instructions()
+        return [{"role": role, "content": file_instructions}] if file_instructions else []
+
     def _create_file_instructions(self) -> str:
         """Create instructions about file mappings."""
+        if self._file_instructions_cache is not None:
+            return self._file_instructions_cache
         if not self.file_mapping:
             return ""
             
-        file_info = "\n".join([
+        file_info = "\n".join(
             f"- File ID '{file_id}' is '{info['filename']}'"
             for file_id, info in self.file_mapping.items()
-        ])
+        )
         
-        return f"""
+        self._file_instructions_cache = f"""
 IMPORTANT - File name mapping information:
 When working with files, please note the following filename mappings:
 {file_info}
 
 When reading files in your code, use the File IDs, but refer to the original filenames in your communications.
 """
+        return self._file_instructions_cache
 
     def initialize(self) -> None:
         """Initialize the OpenAI assistant with file management."""
-        if self.verbose:
-            print("\nStarting initialization...")
+        run_sync(self.ainitialize())
+
+    async def ainitialize(self) -> None:
+        """Asynchronously initialize the OpenAI assistant with file management."""
+        logger.debug("Starting initialization of %s", self.name)
             
-        # Upload all files first and collect their IDs
-        file_ids = []
-        for file_path in self.files:
-            file_id = self._upload_file(file_path)
-            file_ids.append(file_id)
+        # Upload all files concurrently and collect their IDs
+        file_ids = list(await asyncio.gather(*[self._upload_file(file_path) for file_path in self.files]))
             
-        # Enhance instructions with file mapping information
-        enhanced_instructions = f"{self.instructions}\n\n{self._create_file_instructions()}"
+        # The file mapping is sent once per thread, not with every run's instructions
+        logger.debug("Creating assistant with file IDs %s", file_ids)
         
-        if self.verbose:
-            print("\nCreating assistant with:")
-            print(f"Enhanced instructions: {enhanced_instructions[:200]}...")
-            print(f"File IDs: {file_ids}")
+        # Reuse an assistant created earlier with the same files and configuration
+        assistant_key = sha256_hex(serialization.dumps(
+            [sorted(file_ids), sha256_hex(self.instructions.encode()), self.model, self.tools],
+            sort_keys=True
+        ).encode())
+        self._assistant_key = assistant_key
+        self.assistant_id = await self._find_cached_assistant(assistant_key)
+        if self.assistant_id:
+            logger.debug("Reusing assistant %s", self.assistant_id)
+            return
         
         try:
             # Create the assistant with uploaded files
             creation_params = {
                 "name": self.name,
-                "instructions": enhanced_instructions,
+                "instructions": self.instructions,
                 "tools": self.tools,
                 "model": self.model,
             }
@@ -132,136 +256,286 @@ When reading files in your code, use the File IDs, but refer to the original fil
                     }
                 }
                 
-            if self.verbose:
-                print("\nCreation parameters:")
-                print(creation_params)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Creation parameters: %s", creation_params)
 
-            assistant = self.client.beta.assistants.create(**creation_params)
+            assistant = await self.client.beta.assistants.create(**creation_params)
             self.assistant_id = assistant.id
+            self.registry.set_assistant(assistant_key, assistant.id, file_ids)
             
-            if self.verbose:
-                print("\nAssistant created successfully:")
-                print(f"Assistant ID: {self.assistant_id}")
-                print(f"Model: {self.model}")
-                print(f"Tools: {', '.join(t['type'] for t in self.tools)}")
-                print(f"Files attached: {len(file_ids)}")
+            logger.debug(
+                "Assistant created: %s (model=%s, files attached=%d)",
+                self.assistant_id, self.model, len(file_ids)
+            )
                 
         except Exception as e:
-            print(f"\nError creating assistant: {str(e)}")
+            logger.error("Error creating assistant: %s", e)
             raise
 
-    def run_analysis(
-        self, 
+    async def _connect_websocket(self) -> None:
+        """Open the Responses API WebSocket, falling back to HTTP if the upgrade is refused."""
+        from websockets.asyncio.client import connect
+        from websockets.exceptions import InvalidStatus
+
+        try:
+            self._ws = await connect(
+                RESPONSES_WS_URL,
+                additional_headers={
+                    "Authorization": f"Bearer {self.client.api_key}",
+                    "OpenAI-Beta": RESPONSES_WS_BETA
+                },
+                max_size=None
+            )
+            logger.debug("Opened Responses WebSocket for %s", self.name)
+        except InvalidStatus as e:
+            if e.response.status_code != 426:
+                raise
+            logger.warning("Responses WebSocket not available (426), falling back to HTTP")
+            self.use_websocket = False
+
+    async def _stream_websocket(
+        self,
         query: str,
-        additional_files: Optional[List[str]] = None,
-        thread_id: Optional[str] = None,
-        max_retries: int = 3,
-        retry_delay: int = 5
-    ) -> Dict[str, Any]:
-        """Run analysis using the assistant."""
+        thread_id: Optional[str],
+        run_info: Dict[str, str]
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Run one turn over the Responses WebSocket, yielding (item_id, text) deltas."""
+        async with self._ws_lock:
+            # A concurrent turn may have failed and dropped the connection since the
+            # transport was chosen, so reconnect under the same lock that uses it
+            if self._ws is None:
+                await self._connect_websocket()
+                if self._ws is None:
+                    raise Exception("Responses WebSocket is no longer available; retry over HTTP")
+            thread_id = thread_id or f"ws_{uuid.uuid4().hex}"
+            run_info["thread_id"] = thread_id
+            tools = [
+                {**tool, "container": {"type": "auto", "file_ids": list(self.file_mapping)}}
+                if tool["type"] == "code_interpreter" else tool
+                for tool in self.tools
+            ]
+            request = {
+                "type": "response.create",
+                "model": self.model,
+                "instructions": self.instructions,
+                "input": [{"role": "user", "content": query}],
+                "tools": tools,
+                "temperature": self.temperature
+            }
+            # Append to the previous turn instead of resending the history
+            if thread_id in self._response_chain:
+                request["previous_response_id"] = self._response_chain[thread_id]
+            else:
+                request["input"] = self._file_mapping_messages("developer") + request["input"]
+
+            try:
+                await self._ws.send(serialization.dumps(request))
+                async for frame in self._ws:
+                    event = serialization.loads(frame)
+                    if event["type"] == "response.created":
+                        run_info["run_id"] = event["response"]["id"]
+                    elif event["type"] == "response.output_text.delta":
+                        yield event["item_id"], event["delta"]
+                    elif event["type"] == "response.completed":
+                        self._response_chain[thread_id] = event["response"]["id"]
+                        run_info["run_id"] = event["response"]["id"]
+                        return
+                    elif event["type"] in ["response.failed", "error"]:
+                        raise Exception(f"Response failed: {event}")
+                raise Exception("Responses WebSocket closed before completion")
+            except Exception:
+                if self._ws is not None:
+                    await self._ws.close()
+                    self._ws = None
+                raise
+
+    async def _ensure_transport(self) -> None:
+        """Settle on WebSocket or HTTP before a thread ID or run depends on the choice."""
+        if self.use_websocket:
+            async with self._ws_lock:
+                if self._ws is None:
+                    await self._connect_websocket()
+
+    async def acreate_thread(self) -> str:
+        """Start a conversation and return its thread ID, to pass to later analyses."""
+        await self._ensure_transport()
+        if self.use_websocket:
+            return f"ws_{uuid.uuid4().hex}"
         if not self.assistant_id:
-            self.initialize()
+            await self.ainitialize()
+        thread = await self.client.beta.threads.create(messages=self._file_mapping_messages())
+        logger.debug("Created new thread: %s", thread.id)
+        return thread.id
+
+    async def _stream_run(
+        self,
+        query: str,
+        thread_id: Optional[str],
+        run_info: Dict[str, str]
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Stream one run on the assistant, yielding (message_id, text) deltas."""
+        if not self.assistant_id:
+            await self.ainitialize()
+            
+        logger.debug("Starting analysis with query: %s", query)
             
-        if self.verbose:
-            print(f"\nStarting analysis with query: {query}")
+        await self._ensure_transport()
+        if self.use_websocket:
+            async for delta in self._stream_websocket(query, thread_id, run_info):
+                yield delta
+            return
             
-        # Create a new thread if none exists
-        if not thread_id:
-            thread = self.client.beta.threads.create()
-            thread_id = thread.id
-            if self.verbose:
-                print(f"Created new thread: {thread_id}")
+        # Create a new thread if none exists, or if the ID was issued for the WebSocket
+        # before a later reconnect fell back to HTTP
+        if not thread_id or thread_id.startswith("ws_"):
+            thread_id = await self.acreate_thread()
+        run_info["thread_id"] = thread_id
                 
         # Create the message
-        message = self.client.beta.threads.messages.create(
+        await self.client.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=query
         )
         
-        if self.verbose:
-            print(f"Created message in thread {thread_id}")
+        logger.debug("Created message in thread %s", thread_id)
         
-        # Create and run the assistant
-        run = self.client.beta.threads.runs.create(
+        # Run the assistant, receiving message deltas as they are generated
+        last_part = None
+        async with self.client.beta.threads.runs.stream(
             thread_id=thread_id,
             assistant_id=self.assistant_id
-        )
-        
-        if self.verbose:
-            print(f"Started run {run.id}")
-        
-        # Wait for completion with retries
-        retries = 0
-        while True:
-            try:
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id=thread_id,
-                    run_id=run.id
-                )
-                
-                if self.verbose:
-                    print(f"Run status: {run.status}")
-                
-                if run.status == "completed":
-                    break
-                elif run.status in ["failed", "expired", "cancelled"]:
-                    raise Exception(f"Run failed with status: {run.status}")
-                elif retries >= max_retries:
-                    raise Exception("Max retries reached")
-                    
-                time.sleep(1)  # Short delay between status checks
-                
-            except Exception as e:
-                retries += 1
-                if retries == max_retries:
-                    raise Exception(f"Max retries reached: {str(e)}")
-                print(f"Retry {retries}/{max_retries} after error: {str(e)}")
-                time.sleep(retry_delay)
+        ) as stream:
+            async for event in stream:
+                if event.event == "thread.run.created":
+                    run_info["run_id"] = event.data.id
+                    logger.debug("Started run %s", event.data.id)
+                elif event.event == "thread.message.delta":
+                    for content in event.data.delta.content or []:
+                        if content.type == "text":
+                            text = content.text.value if content.text and content.text.value else ""
+                        elif content.type == "image_file":
+                            text = "[Image generated]"
+                        else:
+                            text = "[Content of unsupported type]"
+                        if not text:
+                            continue
+                        # Separate content parts the same way a listed message is joined
+                        part = (event.data.id, content.index)
+                        if content.index > 0 and part != last_part:
+                            text = "\n" + text
+                        last_part = part
+                        yield event.data.id, text
+                elif event.event in ["thread.run.failed", "thread.run.expired", "thread.run.cancelled"]:
+                    raise Exception(f"Run failed with status: {event.data.status}")
+
+    async def astream_analysis(
+        self,
+        query: str,
+        thread_id: Optional[str] = None,
+        run_info: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the assistant's response text as it is generated.
         
-        # Get the messages
-        messages = self.client.beta.threads.messages.list(
+        If run_info is given, it is filled with the thread_id and run_id used.
+        """
+        async for _, chunk in self._stream_run(query, thread_id, {} if run_info is None else run_info):
+            yield chunk
+
+    def run_analysis(
+        self, 
+        query: str,
+        additional_files: Optional[List[str]] = None,
+        thread_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Run analysis using the assistant."""
+        return run_sync(self.arun_analysis(
+            query,
+            additional_files=additional_files,
             thread_id=thread_id
-        )
+        ))
+
+    async def arun_analysis(
+        self, 
+        query: str,
+        additional_files: Optional[List[str]] = None,
+        thread_id: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """Asynchronously run analysis using the assistant, optionally forwarding tokens to on_token."""
+        run_info: Dict[str, str] = {}
+        messages: Dict[str, io.StringIO] = {}
+        async for message_id, chunk in self._stream_run(query, thread_id, run_info):
+            messages.setdefault(message_id, io.StringIO()).write(chunk)
+            if on_token:
+                on_token(chunk)
+        
+        logger.debug("Run completed in thread %s", run_info.get("thread_id"))
         
-        if self.verbose:
-            print("Retrieved messages")
+        if not messages:
+            return {"error": "No assistant response found"}
         
         # Return the last assistant message
-        for msg in messages.data:
-            if msg.role == "assistant":
-                # Handle different content types
-                content_parts = []
-                for content in msg.content:
-                    if hasattr(content, 'text'):
-                        content_parts.append(content.text.value)
-                    elif hasattr(content, 'image_file'):
-                        content_parts.append("[Image generated]")
-                    else:
-                        content_parts.append("[Content of unsupported type]")
-                
-                response_content = "\n".join(content_parts)
-                return {
-                    "content": response_content,
-                    "thread_id": thread_id,
-                    "run_id": run.id
-                }
-            
-        return {"error": "No assistant response found"}
+        last_message = list(messages.values())[-1]
+        return {
+            "content": last_message.getvalue(),
+            "thread_id": run_info["thread_id"],
+            "run_id": run_info.get("run_id")
+        }
+
+    async def _delete_file(self, file_id: str) -> None:
+        """Delete an uploaded file, reporting rather than raising on failure."""
+        try:
+            await self.client.files.delete(file_id)
+            self.registry.remove_file(file_id)
+            logger.debug("Deleted file %s", file_id)
+        except Exception as e:
+            logger.error("Error deleting file %s: %s", file_id, e)
 
-    def cleanup(self):
-        """Clean up by deleting uploaded files."""
-        if self.verbose:
-            print("\nStarting cleanup...")
+    async def _delete_assistant(self, key: str, assistant_id: str) -> None:
+        """Delete a registered assistant, reporting rather than raising on failure."""
+        try:
+            await self.client.beta.assistants.delete(assistant_id)
+            logger.debug("Deleted assistant %s", assistant_id)
+        except NotFoundError:
+            pass
+        except Exception as e:
+            logger.error("Error deleting assistant %s: %s", assistant_id, e)
+            return
+        self.registry.remove_assistant(key)
+
+    def cleanup(self, purge: bool = False):
+        """Clean up connections; with purge=True also delete the uploaded files and their assistants."""
+        run_sync(self.acleanup(purge=purge))
+
+    async def acleanup(self, purge: bool = False):
+        """
+        Asynchronously clean up connections.
+        
+        Uploaded files, the assistant and WebSocket conversation chains are kept so later
+        runs reuse them. With purge=True the files are deleted, along with every registered
+        assistant built on them, and the chains are forgotten.
+        """
+        logger.debug("Starting cleanup of %s", self.name)
             
-        for file_id in self.file_mapping:
-            try:
-                self.client.files.delete(file_id)
-                if self.verbose:
-                    print(f"Deleted file {file_id}")
-            except Exception as e:
-                print(f"Error deleting file {file_id}: {str(e)}")
-        self.file_mapping.clear()
+        if purge:
+            assistants = self.registry.assistants_using(self.file_mapping)
+            if self._assistant_key and self.assistant_id:
+                assistants[self._assistant_key] = self.assistant_id
+            await asyncio.gather(
+                *[self._delete_file(file_id) for file_id in list(self.file_mapping)],
+                *[self._delete_assistant(key, assistant_id) for key, assistant_id in assistants.items()],
+                return_exceptions=True
+            )
+            self.file_mapping.clear()
+            self._invalidate_instructions()
+            self.assistant_id = None
+            self._assistant_key = None
+            self._response_chain.clear()
+        
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
         
-        if self.verbose:
-            print("Cleanup completed")
\ No newline at end of file
+        logger.debug("Cleanup of %s completed", self.name)
\ No newline at end of file
@@ -1,53 +1,74 @@
-from typing import Dict, List, Tuple
-from base import CodeInterpreterAgent
+from typing import Callable, Dict, List, Optional, Tuple
+from base import CodeInterpreterAgent, create_async_client, run_sync
 from actor_metadata import ActorMetadata
+from collections import defaultdict
+import asyncio
+import logging
+import re
 import time
-from openai import OpenAI
-import json
+
+logger = logging.getLogger(__name__)
+
+# Plan lines look like "1. actor_name: task description"
+_PLAN_RE = re.compile(r'^[ \t]*(?:\d+\.[ \t]*)?([A-Za-z_]\w*)[ \t]*:[ \t]*(.+?)[ \t]*$', re.M)
+# Batched plans are introduced by "Query N:" header lines, possibly with markdown
+# emphasis or heading marks and trailing text (e.g. "**Query 1:** ..." or "### Query 2")
+_QUERY_HEADER_RE = re.compile(r'^[ \t#>*_]*Query[ \t]+(\d+)\b.*$', re.M | re.I)
+
+# Escapes backslashes in text placed into prompts
+_BS_TABLE = str.maketrans({"\\": "\\\\"})
+
+PLANNER_SYSTEM_PROMPT = """Create an efficient execution plan with one call per actor, minimizing intermediate steps.
+        1. Consolidate tasks where possible to reduce actor interactions.
+        2. Leverage existing context from previous runs.
+        3. Ensure continuity of analysis without unnecessary redundancies."""
 
 class OrchestratorContext:
     """Maintains context between runs"""
     def __init__(self):
         self.threads: Dict[str, str] = {}
-        self.actor_results: Dict[str, List[Dict]] = {}
+        self.actor_results: Dict[str, List[Dict]] = defaultdict(list)
         self.history: List[Dict] = []
+        # Backslash-escaped formatted history, extended incrementally per result
+        self._escaped_history: Dict[str, str] = {}
     
     def add_result(self, actor: str, result: Dict):
         """Add a result to actor's history"""
-        if actor not in self.actor_results:
-            self.actor_results[actor] = []
         self.actor_results[actor].append(result)
-    
-    def get_actor_history(self, actor: str) -> str:
-        """Get formatted history for an actor"""
-        if actor not in self.actor_results:
-            return "No previous context."
         
-        history = []
-        for result in self.actor_results[actor]:
-            history.append(f"Previous analysis: {result.get('content', 'No content')}")
-        return "\n\n".join(history)
+        entry = f"Previous analysis: {result.get('content', 'No content')}".translate(_BS_TABLE)
+        if actor in self._escaped_history:
+            entry = f"{self._escaped_history[actor]}\n\n{entry}"
+        self._escaped_history[actor] = entry
+    
+    def get_escaped_actor_history(self, actor: str) -> str:
+        """Get formatted history for an actor with backslashes escaped for prompts"""
+        return self._escaped_history.get(actor, "No previous context.")
 
 class EnhancedOrchestrator:
     def __init__(self, api_key: str, verbose: bool = True):
-        self.client = OpenAI(api_key=api_key)
+        # One pooled client shared by the planner and every registered actor
+        self.client = create_async_client(api_key)
         self.actors: Dict[str, Tuple[CodeInterpreterAgent, ActorMetadata]] = {}
+        # Output goes through logging; verbose is kept for API compatibility
         self.verbose = verbose
         self.context = OrchestratorContext()
+        # Plans keyed by query, registered actors and which actors have context
+        self._plan_cache: Dict[Tuple, List[Tuple[str, str]]] = {}
         
-    def log(self, message: str, level: str = "INFO"):
-        if self.verbose:
-            print(f"\n[Orchestrator:{level}] {message}")
+    def log(self, message: str, *args, level: str = "INFO"):
+        logger.log(getattr(logging, level), message, *args)
     
     def register_actor(self, name: str, agent: CodeInterpreterAgent, metadata: ActorMetadata):
+        agent.client = self.client
         self.actors[name] = (agent, metadata)
-        self.log(f"Registered {name} with access to {metadata.file_path}")
+        self.log("Registered %s with access to %s", name, metadata.file_path)
     
     def _escape_backslashes(self, value: str) -> str:
-        return value.replace("\\", "\\\\")
+        return value.translate(_BS_TABLE) if "\\" in value else value
     
     def _create_actor_prompt(self, actor_name: str, task: str) -> str:
-        history = self._escape_backslashes(self.context.get_actor_history(actor_name))
+        history = self.context.get_escaped_actor_history(actor_name)
         task = self._escape_backslashes(task)
         
         prompt = f"""Task: {task}
@@ -62,70 +83,194 @@ Requirements:
 4. Return clear, structured results."""
         return prompt
     
-    def _plan_execution(self, query: str) -> List[Tuple[str, str]]:
+    def _describe_actors(self) -> str:
         actor_descriptions = []
         for name, (_, meta) in self.actors.items():
             desc = f"Actor '{name}':\n- Data: {meta.data_description}\n- Previous context: {'Yes' if name in self.context.actor_results else 'No'}\n"
             actor_descriptions.append(desc)
-        
-        system_prompt = """Create an efficient execution plan with one call per actor, minimizing intermediate steps.
-        1. Consolidate tasks where possible to reduce actor interactions.
-        2. Leverage existing context from previous runs.
-        3. Ensure continuity of analysis without unnecessary redundancies."""
-
-        user_prompt = f"""Query: "{query}"
-
-Available actors:
-{chr(10).join(actor_descriptions)}
-
-Create a minimal execution plan. Format:
-1. actor_name: complete_task_description"""
-
-        response = self.client.chat.completions.create(
+        return "\n".join(actor_descriptions)
+    
+    def _plan_cache_key(self, query: str) -> Tuple:
+        return (
+            query.strip(),
+            frozenset(self.actors),
+            frozenset(name for name in self.actors if name in self.context.actor_results)
+        )
+    
+    def _parse_plan(self, content: str) -> List[Tuple[str, str]]:
+        return [
+            (m.group(1), m.group(2))
+            for m in _PLAN_RE.finditer(content)
+            if m.group(1) in self.actors
+        ]
+    
+    def _log_plan(self, steps: List[Tuple[str, str]]):
+        if logger.isEnabledFor(logging.INFO):
+            self.log("Execution plan:")
+            for i, (actor, task) in enumerate(steps, 1):
+                self.log("%d. %s -> %s", i, actor, task)
+    
+    async def _complete_plan(self, user_prompt: str) -> str:
+        response = await self.client.chat.completions.create(
             model="gpt-4o",
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": PLANNER_SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt}
             ],
             temperature=0
         )
+        return response.choices[0].message.content
+    
+    async def _plan_execution(self, query: str) -> List[Tuple[str, str]]:
+        steps = await self._plan_single(query)
+        self._log_plan(steps)
+        return steps
+    
+    async def _plan_single(self, query: str) -> List[Tuple[str, str]]:
+        """Plan one query, caching the plan only if it parsed into steps."""
+        key = self._plan_cache_key(query)
+        if key in self._plan_cache:
+            self.log("Reusing cached execution plan")
+            steps = self._plan_cache[key]
+        else:
+            user_prompt = f"""Query: "{query}"
+
+Available actors:
+{self._describe_actors()}
+
+Create a minimal execution plan. Format:
+1. actor_name: complete_task_description"""
+
+            steps = self._parse_plan(await self._complete_plan(user_prompt))
+            if steps:
+                self._plan_cache[key] = steps
+        return steps
+    
+    async def _plan_many(self, queries: List[str]) -> List[List[Tuple[str, str]]]:
+        """Plan several queries with a single planner call, reusing cached plans."""
+        keys = [self._plan_cache_key(query) for query in queries]
+        plans: List[Optional[List[Tuple[str, str]]]] = [self._plan_cache.get(key) for key in keys]
+        pending = [i for i, plan in enumerate(plans) if plan is None]
         
-        steps = []
-        for line in response.choices[0].message.content.strip().split("\n"):
-            if ':' in line and line.strip():
-                actor, task = line.split(":", 1)
-                actor = actor.strip().split(".", 1)[-1].strip()
-                if actor in self.actors:
-                    steps.append((actor, self._escape_backslashes(task.strip())))
-        
-        self.log("Execution plan:")
-        for i, (actor, task) in enumerate(steps, 1):
-            self.log(f"{i}. {actor} -> {task}")
+        if pending:
+            numbered_queries = "\n".join(f'{n}. "{queries[i]}"' for n, i in enumerate(pending, 1))
+            user_prompt = f"""Queries:
+{numbered_queries}
+
+Available actors:
+{self._describe_actors()}
+
+Create a minimal execution plan for each query. Format:
+Query 1:
+1. actor_name: complete_task_description
+Query 2:
+1. actor_name: complete_task_description"""
+
+            # re.split yields [preamble, number, body, number, body, ...]
+            sections = _QUERY_HEADER_RE.split(await self._complete_plan(user_prompt))
+            parsed = {int(n): self._parse_plan(body) for n, body in zip(sections[1::2], sections[2::2])}
+            for n, i in enumerate(pending, 1):
+                if parsed.get(n):
+                    self._plan_cache[keys[i]] = plans[i] = parsed[n]
             
-        return steps
+            # A query whose section was missing or unparseable is planned on its own
+            missing = [i for i in pending if plans[i] is None]
+            for i, steps in zip(missing, await asyncio.gather(*[self._plan_single(queries[i]) for i in missing])):
+                plans[i] = steps
+        
+        return plans
     
-    def _execute_actor(self, actor_name: str, task: str) -> Dict:
+    def _schedule_waves(self, plan: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        """Group plan steps into waves whose steps can run concurrently.
+
+        A step waits for an earlier step when its task text mentions that step's
+        actor, or when both target the same actor (one active run per thread).
+        """
+        levels: List[int] = []
+        for i, (actor_name, task) in enumerate(plan):
+            level = 0
+            for j, (other_actor, _) in enumerate(plan[:i]):
+                if other_actor == actor_name or other_actor in task:
+                    level = max(level, levels[j] + 1)
+            levels.append(level)
+        
+        waves: List[List[Tuple[str, str]]] = [[] for _ in range(max(levels, default=-1) + 1)]
+        for step, level in zip(plan, levels):
+            waves[level].append(step)
+        return waves
+    
+    async def _execute_actor(
+        self,
+        actor_name: str,
+        task: str,
+        on_token: Optional[Callable[[str, str], None]] = None
+    ) -> Dict:
         agent, _ = self.actors[actor_name]
-        self.log(f"Executing {actor_name} with task: {task}")
+        self.log("Executing %s with task: %s", actor_name, task)
         prompt = self._create_actor_prompt(actor_name, task)
         thread_id = self.context.threads.get(actor_name)
-        result = agent.run_analysis(prompt, thread_id=thread_id)
-        if not thread_id and result.get("thread_id"):
+        result = await agent.arun_analysis(
+            prompt,
+            thread_id=thread_id,
+            on_token=(lambda chunk: on_token(actor_name, chunk)) if on_token else None
+        )
+        if result.get("thread_id") and result["thread_id"] != thread_id:
             self.context.threads[actor_name] = result["thread_id"]
-            self.log(f"Created thread for {actor_name}: {result['thread_id']}")
+            self.log("Created thread for %s: %s", actor_name, result["thread_id"])
         self.context.add_result(actor_name, result)
         return result
     
     def run_analysis(self, query: str, maintain_context: bool = True) -> Dict:
+        return run_sync(self.arun_analysis(query, maintain_context=maintain_context))
+    
+    async def arun_analysis(
+        self,
+        query: str,
+        maintain_context: bool = True,
+        on_token: Optional[Callable[[str, str], None]] = None
+    ) -> Dict:
+        """Run the analysis; on_token(actor_name, chunk) receives actor output as it streams."""
         start_time = time.time()
-        self.log(f"Starting analysis: {query}")
+        self.log("Starting analysis: %s", query)
         if not maintain_context:
             self.context = OrchestratorContext()
-        plan = self._plan_execution(query)
+        plan = await self._plan_execution(query)
+        return await self._run_plan(plan, start_time, on_token)
+    
+    def run_many(self, queries: List[str], maintain_context: bool = True) -> List[Dict]:
+        return run_sync(self.arun_many(queries, maintain_context=maintain_context))
+    
+    async def arun_many(
+        self,
+        queries: List[str],
+        maintain_context: bool = True,
+        on_token: Optional[Callable[[str, str], None]] = None
+    ) -> List[Dict]:
+        """Plan a batch of queries in one planner call, then run them in order."""
+        self.log("Starting batch of %d queries", len(queries))
+        if not maintain_context:
+            self.context = OrchestratorContext()
+        plans = await self._plan_many(queries)
+        responses = []
+        for query, plan in zip(queries, plans):
+            self.log("Starting analysis: %s", query)
+            self._log_plan(plan)
+            responses.append(await self._run_plan(plan, time.time(), on_token))
+        return responses
+    
+    async def _run_plan(
+        self,
+        plan: List[Tuple[str, str]],
+        start_time: float,
+        on_token: Optional[Callable[[str, str], None]] = None
+    ) -> Dict:
         results = {}
-        for actor_name, task in plan:
-            result = self._execute_actor(actor_name, task)
-            results[actor_name] = result["content"]
+        for wave in self._schedule_waves(plan):
+            wave_results = await asyncio.gather(
+                *[self._execute_actor(actor_name, task, on_token) for actor_name, task in wave]
+            )
+            for (actor_name, _), result in zip(wave, wave_results):
+                results[actor_name] = result["content"]
         
         execution_time = time.time() - start_time
         final_answer = "\n".join(f"From {actor}:\n{response}" for actor, response in results.items())
@@ -137,10 +282,13 @@ Create a minimal execution plan. Format:
             "results": results,
         }
     
-    def cleanup(self, full: bool = True):
+    def cleanup(self, full: bool = True, purge: bool = False):
+        run_sync(self.acleanup(full=full, purge=purge))
+    
+    async def acleanup(self, full: bool = True, purge: bool = False):
+        """Release actors and, if full, forget context; purge also deletes uploaded files and assistants."""
         self.log("Starting cleanup...")
-        for agent, _ in self.actors.values():
-            agent.cleanup()
+        await asyncio.gather(*[agent.acleanup(purge=purge) for agent, _ in self.actors.values()])
         if full:
             self.context = OrchestratorContext()
         self.log("Cleanup completed")
@@ -3,10 +3,12 @@ from actor_metadata import CUSTOMER_ACTOR_METADATA, ORGANIZATION_ACTOR_METADATA
 from base import CodeInterpreterAgent
 import os
 from dotenv import load_dotenv
+import logging
 
 def main():
     # Load environment
     load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="[%(name)s:%(levelname)s] %(message)s")
     
     # Initialize orchestrator
     orchestrator = EnhancedOrchestrator(api_key=os.getenv('OPENAI_API_KEY'))
@@ -15,13 +17,15 @@ def main():
     customer_agent = CodeInterpreterAgent(
         name=CUSTOMER_ACTOR_METADATA.name,
         instructions=CUSTOMER_ACTOR_METADATA.system_prompt,
-        files=[CUSTOMER_ACTOR_METADATA.file_path]
+        files=[CUSTOMER_ACTOR_METADATA.file_path],
+        client=orchestrator.client
     )
     
     org_agent = CodeInterpreterAgent(
         name=ORGANIZATION_ACTOR_METADATA.name,
         instructions=ORGANIZATION_ACTOR_METADATA.system_prompt,
-        files=[ORGANIZATION_ACTOR_METADATA.file_path]
+        files=[ORGANIZATION_ACTOR_METADATA.file_path],
+        client=orchestrator.client
     )
     
     # Register actors
@@ -60,7 +64,8 @@ def main():
         print(result2['answer'])
         
     finally:
-        # Only do full cleanup at the very end
+        # Only do full cleanup at the very end; uploaded files and assistants are kept for the
+        # next run (pass purge=True to delete them)
         orchestrator.cleanup(full=True)
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+from typing import Callable, Dict, Iterable, Optional
+from pathlib import Path
+import hashlib
+import os
+import serialization
+
+try:
+    import fcntl
+except ImportError:  # fcntl is POSIX-only; elsewhere writes still merge, just without the lock
+    fcntl = None
+
+# Default on-disk location shared by every process on this machine
+REGISTRY_PATH = Path.home() / ".cache" / "orchestrator" / "registry.json"
+
+
+def sha256_hex(data: bytes) -> str:
+    """Hex SHA-256 digest used to key registry entries."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class AssetRegistry:
+    """
+    Persists uploaded file IDs (keyed by content hash) and assistant IDs (keyed by
+    their configuration) so later runs can reuse them instead of recreating them.
+    Each assistant's file IDs are recorded too, so purging files can find the
+    assistants built on them.
+
+    The file is read on first use. Every change re-reads it under a file lock and
+    applies just that change, so processes sharing it don't overwrite each other.
+    """
+
+    def __init__(self, path: Path = REGISTRY_PATH):
+        self.path = path
+        self._data: Optional[Dict[str, Dict]] = None
+
+    @property
+    def data(self) -> Dict[str, Dict]:
+        if self._data is None:
+            self._data = self._read()
+        return self._data
+
+    def get_file(self, digest: str) -> Optional[str]:
+        return self.data["files"].get(digest)
+
+    def set_file(self, digest: str, file_id: str) -> None:
+        def change(data):
+            data["files"][digest] = file_id
+        self._update(change)
+
+    def remove_file(self, file_id: str) -> None:
+        """Forget every entry pointing at a file ID (e.g. after deletion or a 404)."""
+        def change(data):
+            files = data["files"]
+            for digest in [d for d, f in files.items() if f == file_id]:
+                del files[digest]
+        self._update(change)
+
+    def get_assistant(self, key: str) -> Optional[str]:
+        return self.data["assistants"].get(key)
+
+    def set_assistant(self, key: str, assistant_id: str, file_ids: Iterable[str] = ()) -> None:
+        file_ids = list(file_ids)
+        def change(data):
+            data["assistants"][key] = assistant_id
+            data["assistant_files"][assistant_id] = file_ids
+        self._update(change)
+
+    def remove_assistant(self, key: str) -> None:
+        def change(data):
+            assistant_id = data["assistants"].pop(key, None)
+            data["assistant_files"].pop(assistant_id, None)
+        self._update(change)
+
+    def assistants_using(self, file_ids: Iterable[str]) -> Dict[str, str]:
+        """Registered assistants (key -> assistant ID) built on any of the given files."""
+        file_ids = set(file_ids)
+        files_of = self.data["assistant_files"]
+        return {
+            key: assistant_id
+            for key, assistant_id in self.data["assistants"].items()
+            if file_ids.intersection(files_of.get(assistant_id, ()))
+        }
+
+    def _read(self) -> Dict[str, Dict]:
+        data: Dict[str, Dict] = {"files": {}, "assistants": {}, "assistant_files": {}}
+        try:
+            data.update(serialization.loads(self.path.read_bytes()))
+        except (OSError, ValueError):
+            pass
+        return data
+
+    def _update(self, change: Callable[[Dict[str, Dict]], None]) -> None:
+        """Apply a change to the latest saved registry under a file lock, then write it atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_suffix(".lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._data = self._read()
+            change(self._data)
+            tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(serialization.dumps(self._data))
+            os.replace(tmp_path, self.path)
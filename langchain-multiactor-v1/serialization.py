@@ -0,0 +1,21 @@
+from typing import Any, Union
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib module is the fallback
+    orjson = None
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """Serialize to a JSON string, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0).decode()
+    return json.dumps(obj, sort_keys=sort_keys)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse a JSON document, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
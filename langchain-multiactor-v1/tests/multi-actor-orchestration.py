@@ -1,24 +1,106 @@
-from typing import Annotated, List, Dict, Any, TypedDict
+from typing import Annotated, List, Dict, Any, Tuple, TypedDict
+from collections import Counter
 from langgraph.graph import StateGraph, Graph, END, START
+from langgraph.constants import Send
+from langgraph.graph.message import add_messages
 from langchain_core.messages import BaseMessage, HumanMessage
-import operator
+from langchain_core.runnables import RunnableConfig
+import asyncio
+import re
+import time
 from base import CodeInterpreterAgent
 import functools
 from dotenv import load_dotenv
 import os
+from pathlib import Path
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional; a combined regex is the fallback
+    ahocorasick = None
 
 # Load environment variables
 load_dotenv()
 
+# Phrases that signal the analysis is done, and words that call for each actor's dataset
+FINISH_PHRASES = ("analysis complete", "task finished", "final recommendation", "conclusion reached")
+if ahocorasick is not None:
+    # One pass over the message however many phrases there are
+    _FINISH_AUTOMATON = ahocorasick.Automaton()
+    for phrase in FINISH_PHRASES:
+        _FINISH_AUTOMATON.add_word(phrase, phrase)
+    _FINISH_AUTOMATON.make_automaton()
+else:
+    _FINISH_RE = re.compile("|".join(map(re.escape, FINISH_PHRASES)), re.I)
+
+_ORG_RE = re.compile(r"\b(organizations?|compan(y|ies))\b", re.I)
+_CUST_RE = re.compile(r"\b(customers?|individuals?)\b", re.I)
+ACTOR_PATTERNS = {
+    "customer_specialist": _CUST_RE,
+    "organization_specialist": _ORG_RE,
+}
+
+def _is_finished(content: str) -> bool:
+    """Whether a message contains any of the finish phrases."""
+    if ahocorasick is not None:
+        return next(_FINISH_AUTOMATON.iter(content.lower()), None) is not None
+    return _FINISH_RE.search(content) is not None
+
 # Define state types for our graph
 class GraphState(TypedDict):
     """Type for the graph state."""
-    messages: Annotated[List[BaseMessage], operator.add]
+    messages: Annotated[List[BaseMessage], add_messages]
     next: str
     current_actor: str
-    shared_thread: str
+    threads: Dict[str, str]  # Each actor's thread, created once per run and never rewritten
+
+# Compiled graphs keyed by actor names; nodes find the running orchestrator in the config
+_GRAPH_CACHE: Dict[Tuple[str, ...], Graph] = {}
+
+# Uploaded file IDs keyed by (absolute path, mtime, size), shared by every actor instance
+_FILE_CACHE: Dict[Tuple[str, float, int], str] = {}
+# How many live actor instances use each cached file ID
+_FILE_REFS: Counter = Counter()
+
+class CachedUploadMixin:
+    """
+    Reuses files already uploaded by other instances instead of uploading them again.
+    A shared file is only deleted once the last instance using it is cleaned up.
+    """
+    
+    async def _upload_file(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_mtime, stat.st_size)
+        file_id = _FILE_CACHE.get(key)
+        if file_id is None:
+            file_id = await super()._upload_file(file_path)
+            _FILE_CACHE[key] = file_id
+        else:
+            self.file_mapping[file_id] = {
+                'filename': Path(file_path).name,
+                'path': file_path
+            }
+            self._invalidate_instructions()
+        _FILE_REFS[file_id] += 1
+        return file_id
+    
+    async def acleanup(self, **kwargs):
+        # Release this instance's files, leaving out any another live instance still uses
+        for file_id in self.file_mapping:
+            _FILE_REFS[file_id] -= 1
+        for file_id in [file_id for file_id in self.file_mapping if _FILE_REFS[file_id] > 0]:
+            del self.file_mapping[file_id]
+        released = set(self.file_mapping)
+        await super().acleanup(**kwargs)
+        
+        # Files the base class deleted are gone, so their cached IDs are no longer usable
+        deleted = released - set(self.file_mapping)
+        for file_id in deleted:
+            del _FILE_REFS[file_id]
+        for key in [key for key, file_id in _FILE_CACHE.items() if file_id in deleted]:
+            del _FILE_CACHE[key]
 
-class CustomerActor(CodeInterpreterAgent):
+class CustomerActor(CachedUploadMixin, CodeInterpreterAgent):
     """Specialized actor for customer data analysis."""
     def __init__(self):
         super().__init__(
@@ -37,7 +119,7 @@ class CustomerActor(CodeInterpreterAgent):
             verbose=True
         )
 
-class OrganizationActor(CodeInterpreterAgent):
+class OrganizationActor(CachedUploadMixin, CodeInterpreterAgent):
     """Specialized actor for organization data analysis."""
     def __init__(self):
         super().__init__(
@@ -56,6 +138,100 @@ class OrganizationActor(CodeInterpreterAgent):
             verbose=True
         )
 
+def _needed_actors(query: str) -> List[str]:
+    """Actors whose keywords appear in the query."""
+    return [actor_name for actor_name, pattern in ACTOR_PATTERNS.items() if pattern.search(query)]
+
+def _get_orchestrator(config: RunnableConfig) -> "Orchestrator":
+    """The orchestrator running the graph, passed in through the run config."""
+    return config["configurable"]["orchestrator"]
+
+def _dispatch(state: GraphState):
+    """Send the query to every actor whose data it mentions, or to the supervisor."""
+    sends = [
+        Send(actor_name, {"messages": state["messages"], "threads": state["threads"]})
+        for actor_name in _needed_actors(state["messages"][0].content)
+    ]
+    return sends or "supervisor"
+
+def _create_actor_node(name: str):
+    """Create a node for an actor in the graph; the actor itself is looked up per run."""
+    async def node_func(state: GraphState, config: RunnableConfig) -> Dict:
+        orchestrator = _get_orchestrator(config)
+        
+        # Get the last message
+        last_message = state["messages"][-1].content
+        
+        if orchestrator.verbose:
+            print(f"\n{name} processing: {last_message[:100]}...")
+        
+        # Run the analysis
+        response = await orchestrator.actors[name].arun_analysis(last_message, thread_id=state["threads"][name])
+        
+        # Update state
+        return {"messages": [HumanMessage(content=response["content"], name=name)]}
+    
+    return node_func
+
+def _supervisor_node(state: GraphState, config: RunnableConfig) -> Dict[str, str]:
+    """Supervisor node that routes between actors."""
+    messages = state["messages"]
+    content = messages[-1].content
+    
+    # Check for completion indicators
+    if _is_finished(content):
+        return {"next": "FINISH"}
+    
+    # Only actors that haven't answered yet are worth another round-trip
+    responded = {message.name for message in messages}
+    pending = [actor_name for actor_name in _get_orchestrator(config).actors if actor_name not in responded]
+    if not pending:
+        return {"next": "FINISH"}
+    
+    # Route based on content and context
+    for actor_name in pending:
+        if ACTOR_PATTERNS[actor_name].search(content):
+            return {"next": actor_name}
+    
+    # If no clear routing, hand over to the next specialist that hasn't answered
+    return {"next": pending[0]}
+
+def _route_next(state: GraphState) -> str:
+    """Route to the next actor based on supervisor decision."""
+    return state["next"]
+
+def _build_graph(actor_names: Tuple[str, ...]) -> Graph:
+    """Build and compile the orchestration graph for the given actors."""
+    workflow = StateGraph(GraphState)
+    
+    # Add nodes for each actor
+    for actor_name in actor_names:
+        workflow.add_node(actor_name, _create_actor_node(actor_name))
+    
+    # Add supervisor node
+    workflow.add_node("supervisor", _supervisor_node)
+    
+    # Add edges
+    for actor_name in actor_names:
+        workflow.add_edge(actor_name, "supervisor")
+    
+    # Add conditional edges from supervisor to actors
+    workflow.add_conditional_edges(
+        "supervisor",
+        _route_next,
+        {**{actor_name: actor_name for actor_name in actor_names}, "FINISH": END}
+    )
+    
+    # Fan out from the start to every actor the query needs; they run in parallel
+    # and fan back in at the supervisor
+    workflow.add_conditional_edges(
+        START,
+        _dispatch,
+        [*actor_names, "supervisor"]
+    )
+    
+    return workflow.compile()
+
 class Orchestrator:
     """Main orchestrator class for managing multiple actors."""
     
@@ -64,130 +240,79 @@ class Orchestrator:
             "customer_specialist": CustomerActor(),
             "organization_specialist": OrganizationActor()
         }
+        self.verbose = True
         self.graph = self._create_graph()
         
     def _create_graph(self) -> Graph:
-        """Create the graph for actor orchestration."""
-        workflow = StateGraph(GraphState)
-        
-        # Add nodes for each actor
-        for actor_name, actor in self.actors.items():
-            workflow.add_node(actor_name, self._create_actor_node(actor, actor_name))
-        
-        # Add supervisor node
-        workflow.add_node("supervisor", self._supervisor_node())
-        
-        # Add edges
-        for actor_name in self.actors:
-            workflow.add_edge(actor_name, "supervisor")
-        
-        # Add conditional edges from supervisor to actors
-        workflow.add_conditional_edges(
-            "supervisor",
-            self._route_next,
-            {
-                "customer_specialist": "customer_specialist",
-                "organization_specialist": "organization_specialist",
-                "FINISH": END
-            }
-        )
-        
-        # Add starting edge
-        workflow.add_edge(START, "supervisor")
-        
-        return workflow.compile()
-    
-    def _create_actor_node(self, actor: CodeInterpreterAgent, name: str):
-        """Create a node for an actor in the graph."""
-        def node_func(state: GraphState) -> Dict:
-            # Use the same thread if it exists
-            thread_id = state.get("shared_thread")
-            
-            # Get the last message
-            last_message = state["messages"][-1].content
-            
-            if self.verbose:
-                print(f"\n{name} processing: {last_message[:100]}...")
-            
-            # Run the analysis
-            response = actor.run_analysis(last_message, thread_id=thread_id)
-            
-            # Update state
-            return {
-                "messages": [HumanMessage(content=response["content"], name=name)],
-                "shared_thread": response.get("thread_id", thread_id)
-            }
-        
-        return node_func
-    
-    def _supervisor_node(self):
-        """Create the supervisor node that routes between actors."""
-        def get_next_actor(state: GraphState) -> Dict[str, str]:
-            last_message = state["messages"][-1].content.lower()
-            last_actor = state["messages"][-1].name if state["messages"] else None
-            
-            # Check for completion indicators
-            if any(phrase in last_message for phrase in [
-                "analysis complete",
-                "task finished",
-                "final recommendation",
-                "conclusion reached"
-            ]):
-                return {"next": "FINISH"}
-            
-            # Route based on content and context
-            if "organization" in last_message or "company" in last_message:
-                if last_actor != "organization_specialist":
-                    return {"next": "organization_specialist"}
-                
-            if "customer" in last_message or "individual" in last_message:
-                if last_actor != "customer_specialist":
-                    return {"next": "customer_specialist"}
-            
-            # If no clear routing, alternate between specialists
-            if last_actor == "customer_specialist":
-                return {"next": "organization_specialist"}
-            else:
-                return {"next": "customer_specialist"}
-        
-        return get_next_actor
+        """Return the compiled graph for this set of actors, building it only once per process."""
+        key = tuple(self.actors)
+        graph = _GRAPH_CACHE.get(key)
+        if graph is None:
+            graph = _GRAPH_CACHE[key] = _build_graph(key)
+        return graph
     
-    def _route_next(self, state: GraphState) -> str:
-        """Route to the next actor based on supervisor decision."""
-        return state["next"]
+    async def _ensure_threads(self) -> Dict[str, str]:
+        """Create one thread per actor up front; a thread can only host one run at a time."""
+        thread_ids = await asyncio.gather(*(actor.acreate_thread() for actor in self.actors.values()))
+        return dict(zip(self.actors, thread_ids))
     
-    def run(self, query: str, verbose: bool = True) -> Dict[str, Any]:
+    async def run(self, query: str, verbose: bool = True) -> Dict[str, Any]:
         """Run the orchestrator with a query."""
         self.verbose = verbose
         
         if verbose:
             print("\nInitiating analysis with query:", query)
         
+        # A query for a single specialist goes straight to it, skipping the graph
+        needed = _needed_actors(query)
+        if len(needed) == 1:
+            actor_name = needed[0]
+            if verbose:
+                print(f"\nOnly {actor_name} is needed, calling it directly")
+            response = await self.actors[actor_name].arun_analysis(query)
+            return {
+                "messages": [
+                    HumanMessage(content=query),
+                    HumanMessage(content=response["content"], name=actor_name)
+                ],
+                "next": "FINISH",
+                "current_actor": actor_name,
+                "threads": {actor_name: response["thread_id"]}
+            }
+        
         initial_state = {
             "messages": [HumanMessage(content=query)],
             "next": "",
             "current_actor": "",
-            "shared_thread": ""
+            "threads": await self._ensure_threads()
         }
         
-        # Run the graph
-        try:
-            result = self.graph.invoke(initial_state)
-            
-            if verbose:
-                print("\nAnalysis completed successfully!")
-                
-            return result
+        # Run the graph; uploaded files are kept for later runs until cleanup()
+        result = await self.graph.ainvoke(initial_state, config={"configurable": {"orchestrator": self}})
+        
+        if verbose:
+            print("\nAnalysis completed successfully!")
             
-        finally:
-            # Clean up resources
-            if verbose:
-                print("\nCleaning up resources...")
-            for actor in self.actors.values():
-                actor.cleanup()
+        return result
+    
+    async def cleanup(self):
+        """
+        Release the actors' uploaded files; call once when done with the orchestrator.
+        v2 deletes them, while v1 keeps them registered for later runs.
+        """
+        if self.verbose:
+            print("\nCleaning up resources...")
+        await asyncio.gather(*(actor.acleanup() for actor in self.actors.values()))
 
-# Example usage
-if __name__ == "__main__":
+async def run_baseline(orchestrator: Orchestrator, query: str) -> Dict[str, Any]:
+    """Send the query to every actor at once, bypassing the graph, as a parallelism baseline."""
+    names = list(orchestrator.actors)
+    responses = await asyncio.gather(
+        *(orchestrator.actors[name].arun_analysis(query) for name in names)
+    )
+    return dict(zip(names, responses))
+
+async def main():
     orchestrator = Orchestrator()
     
     # Simpler query that requires both datasets but no visualizations
@@ -198,7 +323,26 @@ if __name__ == "__main__":
     
     Please focus on a plain text analysis without generating any visualizations."""
     
-    result = orchestrator.run(query, verbose=True)
+    try:
+        start = time.perf_counter()
+        baseline = await run_baseline(orchestrator, query)
+        baseline_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        result = await orchestrator.run(query, verbose=True)
+        graph_time = time.perf_counter() - start
+    finally:
+        await orchestrator.cleanup()
+    
+    print(f"\nBaseline (direct asyncio.gather over actors): {baseline_time:.2f}s")
+    for name, response in baseline.items():
+        print(f"\n{name}:")
+        print(response.get("content"))
+    print(f"\nGraph run: {graph_time:.2f}s")
     
     print("\nFinal Analysis Result:")
-    print(result)
\ No newline at end of file
+    print(result)
+
+# Example usage
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,6 +7,8 @@ class ActorMetadata:
     data_description: str
     file_path: str
     system_prompt: str
+    # Simple lookups that the orchestrator can run on its cheaper executor deployment
+    lightweight: bool = False
 
 CUSTOMER_ACTOR_METADATA = ActorMetadata(
     name="Customer Data Specialist",
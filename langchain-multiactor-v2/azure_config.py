@@ -1,14 +1,36 @@
-from openai import AzureOpenAI
+from typing import Optional
+from openai import AsyncAzureOpenAI, AzureOpenAI
 from dotenv import load_dotenv
+import httpx
 import os
 
+try:
+    import h2
+except ImportError:  # h2 is optional; without it the pools speak HTTP/1.1
+    h2 = None
+
 # Load environment variables
 load_dotenv()
 
-def get_azure_client():
-    """Get Azure OpenAI client with proper configuration"""
+# Shared connection pools (HTTP/2 when h2 is installed), so every client reuses warm TLS connections
+_POOL_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=128)
+_http_client = httpx.Client(http2=h2 is not None, limits=_POOL_LIMITS, timeout=httpx.Timeout(60.0))
+_async_http_client = httpx.AsyncClient(http2=h2 is not None, limits=_POOL_LIMITS, timeout=httpx.Timeout(60.0))
+
+def get_azure_client(api_key: Optional[str] = None, azure_endpoint: Optional[str] = None):
+    """Get Azure OpenAI client with proper configuration; credentials default to the environment"""
     return AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version="2024-02-15-preview",
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+        api_key=api_key or os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version="2024-05-01-preview",
+        azure_endpoint=azure_endpoint or os.getenv("AZURE_OPENAI_ENDPOINT"),
+        http_client=_http_client
+    )
+
+def get_async_azure_client(api_key: Optional[str] = None, azure_endpoint: Optional[str] = None):
+    """Get async Azure OpenAI client with proper configuration; credentials default to the environment"""
+    return AsyncAzureOpenAI(
+        api_key=api_key or os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version="2024-05-01-preview",
+        azure_endpoint=azure_endpoint or os.getenv("AZURE_OPENAI_ENDPOINT"),
+        http_client=_async_http_client
     )
\ No newline at end of file
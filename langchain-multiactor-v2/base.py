@@ -1,13 +1,36 @@
-from typing import Dict, List, Optional
+from typing import Any, Callable, Coroutine, Dict, List, Optional, TypeVar
 from pathlib import Path
+import asyncio
+import threading
 import os
-from azure_config import get_azure_client
+from azure_config import get_async_azure_client
+
+T = TypeVar("T")
+
+# Background event loop backing the synchronous wrappers
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Run a coroutine on the shared background event loop and wait for its result.
+
+    A single long-lived loop keeps the async client's connection pool valid across
+    synchronous calls, and is safe to call from several threads at once.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="orchestrator-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
 
 class CodeInterpreterAgent:
     """Code Interpreter Agent using Azure OpenAI"""
     
     # Initialize Azure OpenAI client at class level
-    client = get_azure_client()
+    client = get_async_azure_client()
     
     def __init__(
         self,
@@ -33,6 +56,8 @@ class CodeInterpreterAgent:
         self.file_mapping: Dict[str, Dict[str, str]] = {}
         self.files = files or []
         self.assistant_id = None
+        # Rendered file mapping text, rebuilt only when the mapping changes
+        self._file_instructions_cache: Optional[str] = None
         
         if self.verbose:
             print(f"\nInitializing with configuration:")
@@ -45,13 +70,17 @@ class CodeInterpreterAgent:
     
     def initialize(self) -> None:
         """Initialize the Azure OpenAI assistant"""
+        run_sync(self.ainitialize())
+
+    async def ainitialize(self) -> None:
+        """Asynchronously initialize the Azure OpenAI assistant"""
         if self.verbose:
             print("\nStarting initialization...")
             
         # Upload files first
         file_ids = []
         for file_path in self.files:
-            file_id = self._upload_file(file_path)
+            file_id = await self._upload_file(file_path)
             file_ids.append(file_id)
             
         # Create assistant with instructions about files
@@ -78,7 +107,7 @@ class CodeInterpreterAgent:
                 print("\nCreation parameters:")
                 print(creation_params)
                 
-            assistant = self.client.beta.assistants.create(**creation_params)
+            assistant = await self.client.beta.assistants.create(**creation_params)
             self.assistant_id = assistant.id
             
             if self.verbose:
@@ -92,14 +121,14 @@ class CodeInterpreterAgent:
             print(f"\nError creating assistant: {str(e)}")
             raise
 
-    def _upload_file(self, file_path: str) -> str:
+    async def _upload_file(self, file_path: str) -> str:
         """Upload a file and maintain filename mapping."""
         if self.verbose:
             print(f"\nAttempting to upload file: {file_path}")
             
         try:
             with open(file_path, 'rb') as file:
-                response = self.client.files.create(
+                response = await self.client.files.create(
                     file=file,
                     purpose='assistants'
                 )
@@ -108,6 +137,7 @@ class CodeInterpreterAgent:
                     'filename': Path(file_path).name,
                     'path': file_path
                 }
+                self._invalidate_instructions()
                 
                 if self.verbose:
                     print(f"Successfully uploaded {Path(file_path).name} → file ID: {response.id}")
@@ -118,68 +148,128 @@ class CodeInterpreterAgent:
             print(f"Error uploading file {file_path}: {str(e)}")
             raise
             
-    def run_analysis(self, query: str, thread_id: Optional[str] = None) -> Dict[str, Any]:
+    async def acreate_thread(self) -> str:
+        """Start a conversation and return its thread ID, to pass to later analyses."""
+        thread = await self.client.beta.threads.create()
+        return thread.id
+
+    def _invalidate_instructions(self) -> None:
+        """Drop the rendered file mapping after it changes."""
+        self._file_instructions_cache = None
+
+    def _create_file_instructions(self) -> str:
+        """Create instructions about file mappings."""
+        if self._file_instructions_cache is not None:
+            return self._file_instructions_cache
+        if not self.file_mapping:
+            return ""
+            
+        file_info = "\n".join(
+            f"- File ID '{file_id}' is '{info['filename']}'"
+            for file_id, info in self.file_mapping.items()
+        )
+        
+        self._file_instructions_cache = f"""
+IMPORTANT - File name mapping information:
+When working with files, please note the following filename mappings:
+{file_info}
+
+When reading files in your code, use the File IDs, but refer to the original filenames in your communications.
+"""
+        return self._file_instructions_cache
+            
+    def run_analysis(
+        self,
+        query: str,
+        thread_id: Optional[str] = None,
+        model: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """Run analysis using the Azure OpenAI assistant."""
+        return run_sync(self.arun_analysis(query, thread_id=thread_id, model=model, on_token=on_token))
+
+    async def arun_analysis(
+        self,
+        query: str,
+        thread_id: Optional[str] = None,
+        model: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Asynchronously run analysis using the Azure OpenAI assistant.
+        
+        Args:
+            query: The message to send
+            thread_id: Existing thread to continue, or None for a new one
+            model: Deployment to use for this run instead of the assistant's own
+            on_token: Called with each text delta as the assistant streams its reply
+        """
         if not self.assistant_id:
-            self.initialize()
+            await self.ainitialize()
             
         # Create or use thread
         if not thread_id:
-            thread = self.client.beta.threads.create()
-            thread_id = thread.id
+            thread_id = await self.acreate_thread()
             
         # Add message to thread
-        self.client.beta.threads.messages.create(
+        await self.client.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=query
         )
         
-        # Run the assistant
-        run = self.client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=self.assistant_id
-        )
-        
-        # Wait for completion
-        while True:
-            run_status = self.client.beta.threads.runs.retrieve(
-                thread_id=thread_id,
-                run_id=run.id
-            )
+        run_params = {"thread_id": thread_id, "assistant_id": self.assistant_id}
+        if model:
+            run_params["model"] = model
             
-            if run_status.status == "completed":
-                break
-            elif run_status.status in ["failed", "expired", "cancelled"]:
-                raise Exception(f"Run failed with status: {run_status.status}")
-                
-        # Get messages
-        messages = self.client.beta.threads.messages.list(thread_id=thread_id)
+        # Stream the run so it finishes as soon as the service reports completion
+        async with self.client.beta.threads.runs.stream(**run_params) as stream:
+            if on_token:
+                async for token in stream.text_deltas:
+                    on_token(token)
+            await stream.until_done()
+            run = await stream.get_final_run()
+            messages = await stream.get_final_messages()
+            
+        if run.status != "completed":
+            raise Exception(f"Run failed with status: {run.status}")
+        
+        # The stream yields messages oldest first; fall back to listing if it carried none
+        messages = list(reversed(messages))
+        if not messages:
+            listed = await self.client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=4)
+            messages = listed.data
         
         # Get last assistant message
-        for msg in messages.data:
-            if msg.role == "assistant":
-                content_value = None
-                for content in msg.content:
-                    if hasattr(content, 'text'):
-                        content_value = content.text.value
-                        break
-                
-                return {
-                    "content": content_value or "No text content found",
-                    "thread_id": thread_id,
-                    "run_id": run.id
-                }
-                
-        return {"error": "No assistant response found"}
+        assistant_message = next((msg for msg in messages if msg.role == "assistant"), None)
+        if assistant_message is None:
+            return {"error": "No assistant response found"}
+        
+        content_value = next(
+            (content.text.value for content in assistant_message.content
+             if getattr(content, 'type', None) == 'text'),
+            None
+        )
+        return {
+            "content": content_value or "No text content found",
+            "thread_id": thread_id,
+            "run_id": run.id
+        }
     
     def cleanup(self):
         """Clean up resources."""
+        run_sync(self.acleanup())
+
+    async def acleanup(self):
+        """Asynchronously clean up resources; the next run uploads the files and creates an assistant again."""
         for file_id in self.file_mapping:
             try:
-                self.client.files.delete(file_id)
+                await self.client.files.delete(file_id)
                 if self.verbose:
                     print(f"Deleted file {file_id}")
             except Exception as e:
                 print(f"Error deleting file {file_id}: {str(e)}")
-        self.file_mapping.clear()
\ No newline at end of file
+        self.file_mapping.clear()
+        self._invalidate_instructions()
+        # The assistant referenced the deleted files, so it can't be reused
+        self.assistant_id = None
\ No newline at end of file
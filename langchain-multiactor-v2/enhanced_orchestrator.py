@@ -1,43 +1,225 @@
-from typing import Dict, List, Optional, Tuple
-from base import CodeInterpreterAgent
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from base import CodeInterpreterAgent, run_sync
 from actor_metadata import ActorMetadata
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
 import time
-from azure_config import get_azure_client
+from pathlib import Path
+from azure_config import get_async_azure_client, get_azure_client
+
+try:
+    from gptcache import Cache, Config
+    from gptcache.adapter.api import get as cache_get, init_similar_cache, put as cache_put
+except ImportError:  # gptcache is optional; without it every query runs the full pipeline
+    Cache = None
+
+logger = logging.getLogger(__name__)
+
+# Azure deployment used wherever no other deployment is configured
+DEFAULT_DEPLOYMENT = "a1sandboxcp4o"
+
+# One plan step per line: optional "N." numbering, then "actor_name: task"
+_PLAN_RE = re.compile(r'^[ \t]*(?:\d+\.[ \t]*)?([A-Za-z_]\w*)[ \t]*:[ \t]*(.+?)[ \t]*$', re.M)
+
+# Constant prompt sections, built once instead of on every call
+_REQUIREMENTS_BLOCK = (
+    "Requirements:\n"
+    "1. Use the file ID provided in your initialization\n"
+    "2. Reference previous analysis if relevant\n"
+    "3. Be specific and quantitative\n"
+    "4. Return clear, structured results\n"
+    "5. Focus only on your specific capabilities\n\n"
+)
+_PLANNING_HEADER = (
+    "Return only numbered steps in format:\n"
+    "1. actor_name: task_description\n\n"
+    "Available actors:\n"
+)
+_SYNTHESIS_INSTRUCTIONS = (
+    "Create a final answer that:\n"
+    "1. Directly addresses the query\n"
+    "2. Integrates all actor insights\n"
+    "3. Maintains continuity with previous analysis\n"
+    "4. Is clear and concise"
+)
+
+# Upper bound on the history injected into an actor prompt (roughly 1K tokens)
+HISTORY_CHAR_BUDGET = 4000
+# Results shorter than this are used as they are rather than summarized
+SUMMARY_MIN_CHARS = 500
 
 class OrchestratorContext:
-    """Maintains context between runs"""
-    def __init__(self):
+    """Maintains context between runs, persisted to path if one is given"""
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
         # Track threads per actor
         self.threads: Dict[str, str] = {}
         # Track latest results per actor
         self.actor_results: Dict[str, List[Dict]] = {}
+        # Latest content per actor, kept current by add_result
+        self.latest_per_actor: Dict[str, str] = {}
+        # Planner-sized preview of each latest result, sliced once per result
+        self.latest_preview: Dict[str, str] = {}
+        # Formatted history per actor, rebuilt whenever that actor's results change
+        self._history_cache: Dict[str, str] = {}
         # Track conversation history
         self.history: List[Dict] = []
+        # Guards results and history while actors in the same wave finish concurrently
+        self.lock = asyncio.Lock()
+        self._load()
+    
+    def _load(self):
+        """Restore thread IDs and past results saved by an earlier process"""
+        if self.path is None:
+            return
+        try:
+            saved = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        self.threads.update(saved.get("threads", {}))
+        for actor, results in saved.get("actor_results_summary", {}).items():
+            self.actor_results[actor] = list(results)
+            if results:
+                self.latest_per_actor[actor] = results[-1].get("content", "")
+                self.latest_preview[actor] = self.latest_per_actor[actor][:200]
+                self._history_cache[actor] = self._format_history(actor)
+    
+    def save(self):
+        """Persist thread IDs and result summaries, written atomically"""
+        if self.path is None:
+            return
+        data = {
+            "threads": self.threads,
+            "actor_results_summary": {
+                actor: [
+                    {
+                        key: result[key]
+                        for key in ("content", "_summary", "thread_id", "run_id")
+                        if key in result
+                    }
+                    for result in results
+                ]
+                for actor, results in self.actor_results.items()
+            }
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, self.path)
+    
+    def reset(self):
+        """Forget all context, including what was saved to disk"""
+        self.threads.clear()
+        self.actor_results.clear()
+        self.latest_per_actor.clear()
+        self.latest_preview.clear()
+        self._history_cache.clear()
+        self.history.clear()
+        self.save()
     
     def add_result(self, actor: str, result: Dict):
         """Add a result to actor's history"""
         if actor not in self.actor_results:
             self.actor_results[actor] = []
         self.actor_results[actor].append(result)
+        self.latest_per_actor[actor] = result.get('content', '')
+        self.latest_preview[actor] = self.latest_per_actor[actor][:200]
+        self._history_cache[actor] = self._format_history(actor)
+    
+    def set_summary(self, actor: str, result: Dict, summary: str):
+        """Attach a summary to one of an actor's results, unless the context was reset meanwhile"""
+        if not any(r is result for r in self.actor_results.get(actor, ())):
+            return
+        result['_summary'] = summary
+        self._history_cache[actor] = self._format_history(actor)
     
     def get_actor_history(self, actor: str) -> str:
         """Get formatted history for an actor"""
-        if actor not in self.actor_results:
-            return "No previous context."
+        return self._history_cache.get(actor, "No previous context.")
+    
+    def _format_history(self, actor: str) -> str:
+        """
+        Format an actor's history for its prompt.
         
+        Uses each result's summary if one was written, otherwise its full content, newest
+        first until HISTORY_CHAR_BUDGET is spent (the newest entry is cut to fit).
+        """
+        results = self.actor_results[actor]
         history = []
-        for result in self.actor_results[actor]:
-            history.append(f"Previous analysis: {result.get('content', 'No content')}")
-        return "\n\n".join(history)
+        used = 0
+        for result in reversed(results):
+            summary = result.get('_summary') or result.get('content', 'No content')
+            entry = f"Previous analysis: {summary}"[:HISTORY_CHAR_BUDGET]
+            if history and used + len(entry) > HISTORY_CHAR_BUDGET:
+                break
+            history.append(entry)
+            used += len(entry)
+        return "\n\n".join(reversed(history))
 
 class EnhancedOrchestrator:
     """Orchestrator using Azure OpenAI for planning and execution"""
     
-    def __init__(self, verbose: bool = True):
+    def __init__(
+        self,
+        verbose: bool = True,
+        semantic_cache: bool = False,
+        cache_dir: str = "orchestrator_cache",
+        similarity_threshold: float = 0.9,
+        embedding=None,
+        planner_model: Optional[str] = None,
+        executor_model: Optional[str] = None,
+        synthesis_model: str = DEFAULT_DEPLOYMENT,
+        context_path: Optional[Union[str, Path]] = None,
+        summarize_results: bool = False
+    ):
+        """
+        Args:
+            verbose: Kept for API compatibility; output is controlled through logging
+            semantic_cache: Return stored answers for near-duplicate queries (requires gptcache).
+                An answer is only reused while the actors' latest results are the ones it left
+                behind, or with maintain_context=False, where every run starts from empty context
+            cache_dir: Directory holding the semantic cache
+            similarity_threshold: Minimum similarity for a cached answer to be reused
+            embedding: gptcache embedding to use (defaults to its ONNX MiniLM model)
+            planner_model: Azure deployment that writes execution plans; defaults to
+                $AZURE_PLANNER_DEPLOYMENT, else DEFAULT_DEPLOYMENT. Set either to a smaller
+                deployment (e.g. gpt-4o-mini) to opt in to cheaper planning
+            executor_model: Azure deployment for actors whose metadata is lightweight, and for
+                result summaries; defaults to $AZURE_EXECUTOR_DEPLOYMENT, else DEFAULT_DEPLOYMENT
+            synthesis_model: Azure deployment that combines several actors' results
+            context_path: File that keeps this session's thread IDs and result summaries
+                across restarts; by default context lives only in memory
+            summarize_results: Condense each long actor result (SUMMARY_MIN_CHARS or more)
+                to one sentence in the background, at the cost of an extra chat completion
+                per result; otherwise history quotes results within HISTORY_CHAR_BUDGET
+        """
         self.client = get_azure_client()
+        # Async client for direct chat completions (summaries and synthesis)
+        self.async_client = get_async_azure_client()
+        # Background summarization tasks, referenced so they aren't garbage collected
+        self._summary_tasks = set()
+        self.summarize_results = summarize_results
         self.actors: Dict[str, tuple[CodeInterpreterAgent, ActorMetadata]] = {}
         self.verbose = verbose
-        self.context = OrchestratorContext()
+        self.context = OrchestratorContext(Path(context_path) if context_path else None)
+        self.executor_model = executor_model or os.getenv("AZURE_EXECUTOR_DEPLOYMENT", DEFAULT_DEPLOYMENT)
+        self.synthesis_model = synthesis_model
+        
+        self.cache = None
+        if semantic_cache:
+            if Cache is None:
+                raise ImportError("semantic_cache=True requires the gptcache package")
+            self.cache = Cache()
+            init_similar_cache(
+                data_dir=cache_dir,
+                cache_obj=self.cache,
+                embedding=embedding,
+                config=Config(similarity_threshold=similarity_threshold)
+            )
         
         # Create planning assistant
         self.planner = CodeInterpreterAgent(
@@ -57,211 +239,357 @@ class EnhancedOrchestrator:
             - Keep plans minimal but complete
             - Ensure each actor has necessary context
             - Consider previous results when planning""",
-            model="a1sandboxcp4o"  # Azure deployment name
+            model=planner_model or os.getenv("AZURE_PLANNER_DEPLOYMENT", DEFAULT_DEPLOYMENT)
         )
         
-        if verbose:
-            print("Initialized orchestrator with Azure OpenAI")
+        self.log("Initialized orchestrator with Azure OpenAI")
     
-    def log(self, message: str, level: str = "INFO"):
-        """Unified logging with levels"""
-        if self.verbose:
-            print(f"[Orchestrator:{level}] {message}")
+    def log(self, message: str, *args, level: str = "INFO"):
+        """Unified logging with levels; args are formatted lazily by logging"""
+        logger.log(getattr(logging, level), message, *args)
     
     def register_actor(self, name: str, agent: CodeInterpreterAgent, metadata: ActorMetadata):
         """Register an actor with its metadata"""
         self.actors[name] = (agent, metadata)
-        self.log(f"Registered {name} with access to {metadata.file_path}")
-        if self.verbose:
-            self.log(f"Actor capabilities: {metadata.data_description}", "DEBUG")
+        self.log("Registered %s with access to %s", name, metadata.file_path)
+        self.log("Actor capabilities: %s", metadata.data_description, level="DEBUG")
     
     def _create_actor_prompt(self, actor_name: str, task: str) -> str:
-        """Create a context-aware prompt for an actor"""
-        history = self.context.get_actor_history(actor_name)
-        other_results = {}
+        """
+        Create a context-aware prompt for an actor.
         
-        # Get relevant results from other actors
-        for other_actor, results in self.context.actor_results.items():
-            if other_actor != actor_name and results:
-                other_results[other_actor] = results[-1].get('content', '')
+        Stable text (requirements, then the actor's own data description) leads so the
+        prefix is identical across calls and can be served from Azure's prompt cache;
+        everything that changes per call follows the DYNAMIC marker.
+        """
+        _, meta = self.actors[actor_name]
+        history = self.context.get_actor_history(actor_name)
+        other_results = {
+            other_actor: content
+            for other_actor, content in self.context.latest_per_actor.items()
+            if other_actor != actor_name
+        }
         
-        prompt = f"""Task: {task}
-
-Your Previous Context:
-{history}
-
-Other Actors' Recent Results:
-{chr(10).join(f'{actor}: {result}' for actor, result in other_results.items())}
-
-Requirements:
-1. Use the file ID provided in your initialization
-2. Reference previous analysis if relevant
-3. Be specific and quantitative
-4. Return clear, structured results
-5. Focus only on your specific capabilities"""
-
-        return prompt
+        parts = [
+            _REQUIREMENTS_BLOCK,
+            "You are ", actor_name, ". Your data: ", meta.data_description,
+            "\n---DYNAMIC---\nTask: ", task,
+            "\n\nYour Previous Context:\n", history,
+            "\n\nOther Actors' Recent Results:\n",
+            "\n".join(f"{actor}: {result}" for actor, result in other_results.items()),
+        ]
+        return "".join(parts)
     
-    def _plan_execution(self, query: str) -> List[Tuple[str, str]]:
+    async def _plan_execution(self, query: str) -> List[Tuple[str, str]]:
         """Create execution plan using planning assistant"""
-        # Create description of available actors and their context
-        actor_descriptions = []
+        parts = [_PLANNING_HEADER]
+        # Actor data descriptions only change when actors are registered, so they lead
         for name, (_, meta) in self.actors.items():
-            desc = f"Actor '{name}':\n"
-            desc += f"- Data: {meta.data_description}\n"
-            desc += f"- Previous context: {'Yes' if name in self.context.actor_results else 'No'}\n"
-            if name in self.context.actor_results:
-                last_result = self.context.actor_results[name][-1].get('content', '')
-                desc += f"- Latest result: {last_result[:200]}...\n"
-            actor_descriptions.append(desc)
-            
-        planning_query = f"""Create an execution plan for this query:
-        "{query}"
+            parts += ["Actor '", name, "':\n- Data: ", meta.data_description, "\n\n"]
         
-        Available actors:
-        {chr(10).join(actor_descriptions)}
+        # Per-actor context changes every run and goes after the stable prefix
+        parts.append("---DYNAMIC---\nActor context:\n")
+        for name in self.actors:
+            preview = self.context.latest_preview.get(name)
+            if preview is not None:
+                parts += ["- ", name, ": previous context: Yes; latest result: ",
+                          preview, "...\n"]
+            else:
+                parts += ["- ", name, ": previous context: No\n"]
         
-        Previous execution history:
-        {chr(10).join(f'- {h}' for h in self.context.history)}
+        parts.append("\nPrevious execution history:\n")
+        for h in self.context.history:
+            parts += ["- ", h, "\n"]
+        parts += ["\nCreate an execution plan for this query:\n\"", query, "\""]
+        planning_query = "".join(parts)
         
-        Return only numbered steps in format:
-        1. actor_name: task_description"""
+        result = await self.planner.arun_analysis(planning_query)
         
-        result = self.planner.run_analysis(planning_query)
+        # Parse the steps from the response in a single scan
+        steps = [
+            (m.group(1), m.group(2))
+            for m in _PLAN_RE.finditer(result["content"])
+            if m.group(1) in self.actors
+        ]
         
-        # Parse the steps from the response
-        steps = []
-        for line in result["content"].strip().split("\n"):
-            if ':' in line and line.strip():
-                actor, task = line.split(":", 1)
-                actor = actor.strip().split(".", 1)[-1].strip()
-                if actor in self.actors:
-                    steps.append((actor, task.strip()))
-        
-        self.log("Execution plan:")
-        for i, (actor, task) in enumerate(steps, 1):
-            self.log(f"{i}. {actor} -> {task}")
+        if logger.isEnabledFor(logging.INFO):
+            self.log("Execution plan:")
+            for i, (actor, task) in enumerate(steps, 1):
+                self.log("%d. %s -> %s", i, actor, task)
             
         return steps
     
-    def _execute_actor(self, actor_name: str, task: str) -> Dict:
+    async def _execute_actor_async(self, actor_name: str, task: str) -> Dict:
         """Execute a single actor task with proper context"""
-        agent, _ = self.actors[actor_name]
-        self.log(f"Executing {actor_name} with task: {task}")
+        agent, meta = self.actors[actor_name]
+        self.log("Executing %s with task: %s", actor_name, task)
         
         # Create context-aware prompt
         prompt = self._create_actor_prompt(actor_name, task)
         
         # Use existing thread if available
         thread_id = self.context.threads.get(actor_name)
-        result = agent.run_analysis(prompt, thread_id=thread_id)
+        model = self.executor_model if meta.lightweight else None
+        result = await agent.arun_analysis(prompt, thread_id=thread_id, model=model)
         
-        # Store thread ID if new
-        if not thread_id and result.get("thread_id"):
-            self.context.threads[actor_name] = result["thread_id"]
-            self.log(f"Created thread for {actor_name}: {result['thread_id']}")
-            
-        # Store result in context
-        self.context.add_result(actor_name, result)
-        # Add to history
-        self.context.history.append(f"{actor_name}: {task}")
+        async with self.context.lock:
+            # Store thread ID if new
+            if not thread_id and result.get("thread_id"):
+                self.context.threads[actor_name] = result["thread_id"]
+                self.log("Created thread for %s: %s", actor_name, result["thread_id"])
+                
+            # Store result in context
+            self.context.add_result(actor_name, result)
+            if self.summarize_results and len(result.get("content", "")) >= SUMMARY_MIN_CHARS:
+                self._spawn_summary(actor_name, result)
+            # Add to history
+            self.context.history.append(f"{actor_name}: {task}")
         
         return result
     
-    def run_analysis(self, query: str, maintain_context: bool = True) -> Dict:
+    def _cache_fingerprint(self) -> str:
+        """Fingerprint of the registered actors and their latest results"""
+        state = dict(sorted(self.context.latest_per_actor.items()))
+        payload = json.dumps({"actors": sorted(self.actors), "latest": state}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    async def _cache_lookup(self, query: str, fingerprint: str) -> Optional[Dict]:
+        """Return a cached response for a similar query made against the same state"""
+        cached = await asyncio.to_thread(cache_get, query, cache_obj=self.cache)
+        if cached is None:
+            return None
+        entry = json.loads(cached)
+        # Similar wording is only a hit if the actors and their results haven't moved on
+        if entry.get("fingerprint") != fingerprint:
+            return None
+        return entry["response"]
+    
+    def _spawn_summary(self, actor_name: str, result: Dict):
+        """Summarize a result in the background; history falls back to raw content until done"""
+        task = asyncio.create_task(self._summarize_result(actor_name, result))
+        self._summary_tasks.add(task)
+        task.add_done_callback(self._summary_tasks.discard)
+    
+    async def _summarize_result(self, actor_name: str, result: Dict):
+        """Store a one-sentence summary of a result under result['_summary']"""
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.executor_model,
+                messages=[
+                    {"role": "system", "content": "Summarize this analysis in one sentence, keeping key figures."},
+                    {"role": "user", "content": result.get("content", "")}
+                ],
+                max_tokens=80
+            )
+            self.context.set_summary(actor_name, result, response.choices[0].message.content.strip())
+        except Exception as e:
+            self.log("Could not summarize result: %s", e, level="WARNING")
+    
+    async def _stream_synthesis(
+        self, synthesis_prompt: str, on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Stream the final answer from a chat completion on the synthesis deployment.
+        
+        Calling the model directly skips the thread, message and run round-trips of the
+        Assistants API, and streaming hands tokens to on_token as soon as they arrive.
+        """
+        stream = await self.async_client.chat.completions.create(
+            model=self.synthesis_model,
+            messages=[{"role": "user", "content": synthesis_prompt}],
+            stream=True
+        )
+        pieces = []
+        async for chunk in stream:
+            # Azure sends a leading chunk with no choices (content filter results)
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                pieces.append(token)
+                if on_token:
+                    on_token(token)
+        return "".join(pieces)
+    
+    def _build_waves(self, plan: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        """
+        Group plan steps into waves that can run concurrently.
+        
+        A step waits for an earlier step if its task mentions that step's actor, or if
+        both use the same actor (its thread only allows one active run at a time).
+        """
+        waves: List[List[Tuple[str, str]]] = []
+        wave_of: List[int] = []
+        for i, (actor_name, task) in enumerate(plan):
+            wave = 0
+            for j in range(i):
+                earlier_actor = plan[j][0]
+                if earlier_actor == actor_name or earlier_actor in task:
+                    wave = max(wave, wave_of[j] + 1)
+            wave_of.append(wave)
+            if wave == len(waves):
+                waves.append([])
+            waves[wave].append((actor_name, task))
+        return waves
+    
+    def run_analysis(
+        self,
+        query: str,
+        maintain_context: bool = True,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict:
         """
         Run complete analysis while optionally maintaining context.
         
         Args:
             query: The query to analyze
             maintain_context: Whether to maintain context for future queries
+            on_token: Called with each piece of the final answer as it streams in
         """
+        return run_sync(self.arun_analysis(query, maintain_context=maintain_context, on_token=on_token))
+    
+    async def arun_analysis(
+        self,
+        query: str,
+        maintain_context: bool = True,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict:
+        """Asynchronously run complete analysis, executing independent actors concurrently"""
         start_time = time.time()
-        self.log(f"Starting analysis: {query}")
+        self.log("Starting analysis: %s", query)
         
         # Clear context if not maintaining it
         if not maintain_context:
-            self.context = OrchestratorContext()
+            self.context.reset()
+        
+        fingerprint = None
+        if self.cache is not None:
+            fingerprint = self._cache_fingerprint()
+            cached = await self._cache_lookup(query, fingerprint)
+            if cached is not None:
+                self.log("Returning cached analysis for a similar query")
+                if on_token:
+                    on_token(cached["answer"])
+                return {**cached, "execution_time": time.time() - start_time, "cached": True}
         
         try:
-            # Get execution plan
-            plan = self._plan_execution(query)
-            actors_used = [actor for actor, _ in plan]
-            results = {}
+            # Get execution plan; with a single actor there is nothing to choose between
+            if len(self.actors) == 1:
+                plan = [(next(iter(self.actors)), query)]
+                self.log("Single actor registered, skipping planning")
+            else:
+                plan = await self._plan_execution(query)
             
-            # Execute plan
+            # Collapse repeated (actor, task) steps so each runs once per analysis
+            seen = set()
+            unique_plan = []
             for actor_name, task in plan:
-                result = self._execute_actor(actor_name, task)
-                results[actor_name] = result["content"]
-                self.log(f"Completed {actor_name}")
+                key = (actor_name, " ".join(task.lower().split()))
+                if key not in seen:
+                    seen.add(key)
+                    unique_plan.append((actor_name, task))
+            if len(unique_plan) < len(plan):
+                self.log("Dropped %d duplicate plan steps", len(plan) - len(unique_plan))
+            plan = unique_plan
+            actors_used = [actor for actor, _ in plan]
             
-            # Build Actor Results section
-            actor_results = "\n".join(
-                f"From {name}:\n{content}\n" 
-                for name, content in results.items()
-            )
+            # Nothing to execute or synthesize
+            if not plan:
+                self.log("Planner found no applicable actors")
+                return {
+                    "answer": "No applicable actors.",
+                    "execution_time": time.time() - start_time,
+                    "steps_executed": 0,
+                    "actors_used": [],
+                    "results": {}
+                }
             
-            # Build Previous Context Available section
-            previous_context = "\n".join(
-                f"- {actor}: {len(history)} previous results"
-                for actor, history in self.context.actor_results.items()
-            )
+            # Execute plan wave by wave, running each wave's actors concurrently
+            results = {}
+            for wave in self._build_waves(plan):
+                wave_results = await asyncio.gather(
+                    *[self._execute_actor_async(actor_name, task) for actor_name, task in wave]
+                )
+                for (actor_name, _), result in zip(wave, wave_results):
+                    results[actor_name] = result["content"]
+                    self.log("Completed %s", actor_name)
             
-            # Create synthesis prompt with proper string formatting
-            synthesis_prompt = (
-                f"Query: {query}\n\n"
-                f"Actor Results:\n{actor_results}\n\n"
-                f"Previous Context Available:\n{previous_context}\n\n"
-                "Create a final answer that:\n"
-                "1. Directly addresses the query\n"
-                "2. Integrates all actor insights\n"
-                "3. Maintains continuity with previous analysis\n"
-                "4. Is clear and concise"
-            )
+            if len(results) == 1:
+                # A single actor's answer needs no combining, so skip the synthesis run
+                answer = next(iter(results.values()))
+                if on_token:
+                    on_token(answer)
+            else:
+                # Build the synthesis prompt in one pass
+                parts = ["Query: ", query, "\n\nActor Results:\n"]
+                for name, content in results.items():
+                    parts += ["From ", name, ":\n", content, "\n\n"]
+                parts.append("\nPrevious Context Available:\n")
+                for actor, history in self.context.actor_results.items():
+                    parts += ["- ", actor, ": ", str(len(history)), " previous results\n"]
+                parts += ["\n", _SYNTHESIS_INSTRUCTIONS]
+                synthesis_prompt = "".join(parts)
 
-            # Use planner for synthesis
-            synthesis = self.planner.run_analysis(synthesis_prompt)
+                answer = await self._stream_synthesis(synthesis_prompt, on_token)
+                
             execution_time = time.time() - start_time
             
             response = {
-                "answer": synthesis["content"],
+                "answer": answer,
                 "execution_time": execution_time,
                 "steps_executed": len(plan),
                 "actors_used": actors_used,
                 "results": results
             }
             
-            self.log(f"Analysis completed in {execution_time:.2f} seconds")
+            if self.cache is not None:
+                # Key the entry on the context the next lookup will see: the results this run
+                # left behind, or the empty context a non-maintaining run starts from
+                if maintain_context:
+                    fingerprint = self._cache_fingerprint()
+                entry = json.dumps({"fingerprint": fingerprint, "response": response})
+                await asyncio.to_thread(cache_put, query, entry, cache_obj=self.cache)
+            
+            self.context.save()
+            self.log("Analysis completed in %.2f seconds", execution_time)
             return response
             
         except Exception as e:
-            self.log(f"Error during execution: {str(e)}", "ERROR")
+            self.log("Error during execution: %s", e, level="ERROR")
             raise
         
-    def cleanup(self, full: bool = True):
+    def cleanup(self, full: bool = False):
         """
         Clean up resources.
         
         Args:
-            full: If True, clears all context. If False, maintains thread IDs.
+            full: If True, deletes the actors' uploaded files and clears all context; only
+                use this at shutdown. By default files, assistants and thread IDs are all
+                kept, so later queries continue the same Azure threads.
         """
+        run_sync(self.acleanup(full=full))
+    
+    async def acleanup(self, full: bool = False):
+        """Asynchronously clean up resources, releasing every actor concurrently on a full cleanup"""
         self.log("Starting cleanup...")
         
         try:
-            # Always cleanup actors
-            for agent, _ in self.actors.values():
-                agent.cleanup()
-            
-            # Cleanup planner
-            if hasattr(self, 'planner'):
-                self.planner.cleanup()
+            # Let pending summaries land so they are saved with the context
+            await asyncio.gather(*self._summary_tasks, return_exceptions=True)
             
-            # Optionally clear context
+            # A full cleanup deletes the actors' files, so their threads and context go too;
+            # otherwise everything is kept for later queries and the next process
             if full:
-                self.context = OrchestratorContext()
+                agents = [agent for agent, _ in self.actors.values()]
+                if hasattr(self, 'planner'):
+                    agents.append(self.planner)
+                await asyncio.gather(*(agent.acleanup() for agent in agents))
+                self.context.reset()
+            else:
+                self.context.save()
             
             self.log("Cleanup completed")
             
         except Exception as e:
-            self.log(f"Error during cleanup: {str(e)}", "ERROR")
+            self.log("Error during cleanup: %s", e, level="ERROR")
             raise
\ No newline at end of file
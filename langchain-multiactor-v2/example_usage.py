@@ -1,12 +1,14 @@
 from enhanced_orchestrator import EnhancedOrchestrator
 from actor_metadata import CUSTOMER_ACTOR_METADATA, ORGANIZATION_ACTOR_METADATA
 from base import CodeInterpreterAgent
+import logging
 import os
 from dotenv import load_dotenv
 
 def main():
     # Load environment
     load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="[%(name)s:%(levelname)s] %(message)s")
     
     # Initialize orchestrator (no API key needed, it's handled in azure_config)
     orchestrator = EnhancedOrchestrator(verbose=True)
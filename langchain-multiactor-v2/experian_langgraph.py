@@ -1,4 +1,5 @@
 from typing import Annotated, Dict, List, TypedDict, Union
+import asyncio
 import functools
 import operator
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
@@ -6,13 +7,22 @@ from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END, START
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.output_parsers.openai_functions import JsonOutputFunctionsParser
-from openai import AzureOpenAI
-from datetime import datetime
+from openai import NotFoundError
+from azure_config import get_async_azure_client, get_azure_client
+from base import run_sync
+import hashlib
 import json
+import logging
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 import sys
-import time
+
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    # Configured before the module-level setup below so its messages are shown too
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,28 +32,31 @@ AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 
 if not AZURE_OPENAI_KEY or not AZURE_OPENAI_ENDPOINT:
-    print("Error: Azure OpenAI credentials not found in .env file")
+    logger.error("Azure OpenAI credentials not found in .env file")
     sys.exit(1)
 
-# Initialize Azure OpenAI client
-client = AzureOpenAI(
-    api_key=AZURE_OPENAI_KEY,
-    api_version="2024-02-15-preview",
-    azure_endpoint=AZURE_OPENAI_ENDPOINT
-)
+# Initialize Azure OpenAI clients on the shared connection pools from azure_config
+client = get_azure_client(api_key=AZURE_OPENAI_KEY, azure_endpoint=AZURE_OPENAI_ENDPOINT)
 
-print(f"[{datetime.now()}] 🔑 Successfully loaded Azure OpenAI credentials")
+# Async client for thread runs, so independent analysts can run concurrently
+async_client = get_async_azure_client(api_key=AZURE_OPENAI_KEY, azure_endpoint=AZURE_OPENAI_ENDPOINT)
+
+logger.info("🔑 Successfully loaded Azure OpenAI credentials")
+
+# Assistant and file IDs reused across processes
+ASSISTANT_CACHE_PATH = Path.home() / ".cache" / "orchestrator" / "assistants.json"
 
 def create_assistant_with_file(name: str, instructions: str, file_path: str) -> Dict:
     """Create an Azure OpenAI assistant with code interpreter and file access."""
-    print(f"\n[{datetime.now()}] Creating assistant: {name}")
+    logger.info("Creating assistant: %s", name)
     
     # Upload file
-    file = client.files.create(
-        file=open(file_path, "rb"),
-        purpose='assistants'
-    )
-    print(f"[{datetime.now()}] Uploaded file: {file_path} (ID: {file.id})")
+    with open(file_path, "rb") as f:
+        file = client.files.create(
+            file=f,
+            purpose='assistants'
+        )
+    logger.info("Uploaded file: %s (ID: %s)", file_path, file.id)
     
     # Create assistant with code interpreter and file access
     assistant = client.beta.assistants.create(
@@ -57,65 +70,89 @@ def create_assistant_with_file(name: str, instructions: str, file_path: str) ->
             }
         }
     )
-    print(f"[{datetime.now()}] Created assistant: {name} (ID: {assistant.id})")
+    logger.info("Created assistant: %s (ID: %s)", name, assistant.id)
     return {"assistant_id": assistant.id, "file_id": file.id}
 
-def create_thread_and_run(assistant_id: str, file_id: str, user_message: str) -> Dict:
+def get_or_create_assistant(name: str, instructions: str, file_path: str) -> Dict:
+    """Reuse a cached assistant for this name, file contents and instructions, or create one."""
+    with open(file_path, "rb") as f:
+        file_hash = hashlib.sha256(f.read()).hexdigest()
+    key = hashlib.sha256(
+        json.dumps([name, file_path, file_hash, instructions]).encode()
+    ).hexdigest()
+    
+    try:
+        cache = json.loads(ASSISTANT_CACHE_PATH.read_text())
+    except (OSError, ValueError):
+        cache = {}
+    
+    cached = cache.get(key)
+    if cached:
+        try:
+            # Cheap existence check; the assistant may have been deleted server-side
+            client.beta.assistants.retrieve(cached["assistant_id"])
+            logger.info("Reusing assistant: %s (ID: %s)", name, cached["assistant_id"])
+            return cached
+        except NotFoundError:
+            logger.info("Cached assistant for %s no longer exists, recreating", name)
+    
+    created = create_assistant_with_file(name, instructions, file_path)
+    cache[key] = created
+    # Written atomically so an interrupted write can't leave corrupt JSON behind
+    ASSISTANT_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = ASSISTANT_CACHE_PATH.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(cache, indent=2))
+    os.replace(tmp_path, ASSISTANT_CACHE_PATH)
+    return created
+
+async def create_thread_and_run(assistant_id: str, file_id: str, user_message: str) -> Dict:
     """Create a thread and run for an assistant, returning the results."""
-    print(f"\n[{datetime.now()}] Creating thread for assistant: {assistant_id}")
+    logger.debug("Creating thread for assistant: %s", assistant_id)
     
     # Create thread
-    thread = client.beta.threads.create()
-    print(f"[{datetime.now()}] Created thread: {thread.id}")
+    thread = await async_client.beta.threads.create()
+    logger.debug("Created thread: %s", thread.id)
     
     # Add message to thread
-    message = client.beta.threads.messages.create(
+    message = await async_client.beta.threads.messages.create(
         thread_id=thread.id,
         role="user",
         content=user_message
     )
-    print(f"[{datetime.now()}] Added message to thread")
+    logger.debug("Added message to thread")
     
-    # Create run
-    run = client.beta.threads.runs.create(
+    # Stream the run so completion is reported as soon as it happens instead of polled for
+    logger.debug("Waiting for run completion...")
+    async with async_client.beta.threads.runs.stream(
         thread_id=thread.id,
         assistant_id=assistant_id
-    )
-    print(f"[{datetime.now()}] Created run: {run.id}")
-    
-    # Wait for completion
-    print(f"[{datetime.now()}] Waiting for run completion...")
-    while True:
-        run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-        if run.status == 'completed':
-            print(f"[{datetime.now()}] Run completed!")
-            break
-        elif run.status == 'failed':
-            raise Exception(f"Run failed: {run.last_error}")
-        elif run.status == 'requires_action':
-            print(f"[{datetime.now()}] Run requires action: {run.required_action}")
-        print(f"[{datetime.now()}] Current status: {run.status}")
-        time.sleep(1)
-    
-    # Get messages
-    messages = client.beta.threads.messages.list(thread_id=thread.id)
-    result = messages.data[0].content[0].text.value
-    
-    print(f"\n[{datetime.now()}] Assistant {assistant_id} response:")
-    print("=" * 50)
-    print(result)
-    print("=" * 50)
+    ) as stream:
+        await stream.until_done()
+        run = await stream.get_final_run()
+        final_messages = await stream.get_final_messages()
+    logger.debug("Streamed run: %s", run.id)
+    
+    # Anything but a completed run (failed, expired, cancelled, incomplete or waiting on
+    # an action) has no full reply to read
+    if run.status != 'completed':
+        raise Exception(f"Run ended with status {run.status}: {run.last_error or run.incomplete_details}")
+    logger.debug("Run completed!")
+    
+    # The stream already carries the assistant's reply, so no extra messages request is needed
+    result = final_messages[-1].content[0].text.value
+    
+    logger.debug("Assistant %s response:\n%s", assistant_id, result)
     
     return {"thread_id": thread.id, "run_id": run.id, "result": result}
 
 # Create our assistants
-customer_assistant = create_assistant_with_file(
+customer_assistant = get_or_create_assistant(
     "Customer Data Analyst",
     "You are a customer data analyst. Use code interpreter to analyze customer data. Always explain your analysis process.",
     "data/customers-10000.csv"
 )
 
-corporation_assistant = create_assistant_with_file(
+corporation_assistant = get_or_create_assistant(
     "Corporation Data Analyst",
     "You are a corporation data analyst. Use code interpreter to analyze organization data. Always explain your analysis process.",
     "data/organizations-10000.csv"
@@ -129,12 +166,12 @@ class AnalysisState(TypedDict):
     orchestrator_summary: str
 
 
-def analyze_customer_data(state: AnalysisState) -> AnalysisState:
+async def analyze_customer_data(state: AnalysisState) -> AnalysisState:
     """Node for analyzing customer data."""
-    print(f"\n[{datetime.now()}] 👤 CUSTOMER DATA ANALYSIS NODE")
+    logger.info("👤 CUSTOMER DATA ANALYSIS NODE")
     last_message = state["messages"][-1].content
     
-    result = create_thread_and_run(
+    result = await create_thread_and_run(
         customer_assistant["assistant_id"],
         customer_assistant["file_id"],
         last_message
@@ -146,12 +183,12 @@ def analyze_customer_data(state: AnalysisState) -> AnalysisState:
         "results": {**state.get("results", {}), "customer": result["result"]}
     }
 
-def analyze_corporation_data(state: AnalysisState) -> AnalysisState:
+async def analyze_corporation_data(state: AnalysisState) -> AnalysisState:
     """Node for analyzing corporation data."""
-    print(f"\n[{datetime.now()}] 🏢 CORPORATION DATA ANALYSIS NODE")
+    logger.info("🏢 CORPORATION DATA ANALYSIS NODE")
     last_message = state["messages"][-1].content
     
-    result = create_thread_and_run(
+    result = await create_thread_and_run(
         corporation_assistant["assistant_id"],
         corporation_assistant["file_id"],
         last_message
@@ -163,9 +200,27 @@ def analyze_corporation_data(state: AnalysisState) -> AnalysisState:
         "results": {**state.get("results", {}), "corporation": result["result"]}
     }
 
+async def analyze_both(state: AnalysisState) -> AnalysisState:
+    """Node that runs the customer and corporation analysts concurrently."""
+    logger.info("🔀 PARALLEL CUSTOMER + CORPORATION ANALYSIS NODE")
+    customer, corporation = await asyncio.gather(
+        analyze_customer_data(state),
+        analyze_corporation_data(state)
+    )
+    
+    return {
+        **state,
+        "messages": customer["messages"] + corporation["messages"],
+        "results": {
+            **state.get("results", {}),
+            "customer": customer["results"]["customer"],
+            "corporation": corporation["results"]["corporation"]
+        }
+    }
+
 def create_orchestrator(llm: ChatOpenAI):
     """Create the orchestrator that decides which analysts to use."""
-    options = ["CUSTOMER_DATA", "CORPORATION_DATA", "SUMMARIZE", "FINISH"]
+    options = ["CUSTOMER_DATA", "CORPORATION_DATA", "BOTH", "SUMMARIZE", "FINISH"]
     
     function_def = {
         "name": "route",
@@ -194,6 +249,7 @@ def create_orchestrator(llm: ChatOpenAI):
         ("system", """You are a data analysis orchestrator that routes questions to appropriate specialists:
         - CUSTOMER_DATA: For questions about customer information
         - CORPORATION_DATA: For questions about organization information
+        - BOTH: When customer and organization information are both needed (runs both analysts in parallel)
         - SUMMARIZE: When you have enough information to create a final summary
         - FINISH: When the analysis is complete
         
@@ -207,9 +263,9 @@ def create_orchestrator(llm: ChatOpenAI):
             | llm.bind_tools(tools=[function_def])  # Updated to use bind_tools
             | JsonOutputFunctionsParser())
 
-def summarize_results(state: AnalysisState) -> AnalysisState:
+async def summarize_results(state: AnalysisState) -> AnalysisState:
     """Create a final summary of all analysis results."""
-    print(f"\n[{datetime.now()}] 📊 SUMMARIZING RESULTS")
+    logger.info("📊 SUMMARIZING RESULTS")
     
     summary_prompt = f"""Based on the following analysis results, provide a comprehensive summary:
     
@@ -222,16 +278,13 @@ def summarize_results(state: AnalysisState) -> AnalysisState:
     Provide a clear, concise summary that combines these insights.
     """
     
-    result = create_thread_and_run(
+    result = await create_thread_and_run(
         customer_assistant["assistant_id"],
         customer_assistant["file_id"],
         summary_prompt
     )
     
-    print(f"\n[{datetime.now()}] 🎯 FINAL SUMMARY:")
-    print("=" * 50)
-    print(result["result"])
-    print("=" * 50)
+    logger.info("🎯 FINAL SUMMARY:\n%s", result["result"])
     
     return {
         **state,
@@ -249,12 +302,14 @@ def create_analysis_workflow(llm: ChatOpenAI):
     # Add nodes
     workflow.add_node("customer_analyst", analyze_customer_data)
     workflow.add_node("corporation_analyst", analyze_corporation_data)
+    workflow.add_node("both_analysts", analyze_both)
     workflow.add_node("orchestrator", orchestrator)
     workflow.add_node("summarizer", summarize_results)
     
     # Add edges
     workflow.add_edge("customer_analyst", "orchestrator")
     workflow.add_edge("corporation_analyst", "orchestrator")
+    workflow.add_edge("both_analysts", "orchestrator")
     workflow.add_edge("summarizer", "orchestrator")
     
     # Add conditional edges from orchestrator
@@ -264,6 +319,7 @@ def create_analysis_workflow(llm: ChatOpenAI):
         {
             "CUSTOMER_DATA": "customer_analyst",
             "CORPORATION_DATA": "corporation_analyst",
+            "BOTH": "both_analysts",
             "SUMMARIZE": "summarizer",
             "FINISH": END
         }
@@ -274,13 +330,21 @@ def create_analysis_workflow(llm: ChatOpenAI):
     return workflow.compile()
 
 def analyze_data(question: str, llm: ChatOpenAI = ChatOpenAI(model="gpt-4")):
-    """Run the analysis workflow for a given question."""
+    """
+    Run the analysis workflow for a given question.
+    
+    Runs on base's long-lived background loop, which the pooled async client stays bound
+    to; asyncio.run would close that loop after the first call.
+    """
+    return run_sync(aanalyze_data(question, llm))
+
+async def aanalyze_data(question: str, llm: ChatOpenAI = ChatOpenAI(model="gpt-4")):
+    """Asynchronously run the analysis workflow for a given question."""
     chain = create_analysis_workflow(llm)
     
-    print(f"\n[{datetime.now()}] 🚀 Starting analysis for question: {question}")
-    print("=" * 50)
+    logger.info("🚀 Starting analysis for question: %s", question)
     
-    result = chain.invoke({
+    result = await chain.ainvoke({
         "messages": [HumanMessage(content=question)],
         "results": {},
         "next": "",
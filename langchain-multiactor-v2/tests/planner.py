@@ -1,43 +1,244 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
 from datetime import datetime
+from pathlib import Path
 from metadata_models import (
     ExecutionPlan, ExecutionStep, ExecutionMetrics,
     DataType, AnalysisType, ActorCapabilities
 )
 from openai import OpenAI
+import hashlib
+import httpx
 import json
+import logging
+import numpy as np
+import os
+import pickle
 import re
 
+logger = logging.getLogger(__name__)
+
+# One pooled client per API key, shared by every QueryPlanner
+_CLIENTS: Dict[str, OpenAI] = {}
+
+def _get_client(api_key: str) -> OpenAI:
+    """Return the shared client for an API key, creating it on first use"""
+    if api_key not in _CLIENTS:
+        _CLIENTS[api_key] = OpenAI(
+            api_key=api_key,
+            http_client=httpx.Client(
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            )
+        )
+    return _CLIENTS[api_key]
+
+# Classifications as (data type names, analysis type names)
+Classification = Tuple[Tuple[str, ...], Tuple[str, ...]]
+
+# Most normalized queries kept in the exact-match tier
+EXACT_CACHE_SIZE = 1024
+# Near-duplicate queries reuse a cached classification above this cosine similarity
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Most queries kept in the semantic tier per set of registered capabilities (newest win)
+SEMANTIC_CACHE_SIZE = 4096
+SEMANTIC_CACHE_PATH = Path.home() / ".planner_cache" / "semantic.pkl"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Most queries packed into one classification request by create_execution_plans
+BATCH_SIZE = 20
+
+# Keyword patterns for the local classifier, by enum member name. Only names that exist
+# in DataType/AnalysisType are compiled, so the tables can list more than the enums hold.
+_DATA_TYPE_KEYWORDS = {
+    "CUSTOMER": r"\b(customers?|individuals?|demograph|subscri)",
+    "ORGANIZATION": r"\b(organi[sz]ations?|compan(y|ies)|corporat|business|industr)",
+}
+_ANALYSIS_TYPE_KEYWORDS = {
+    "GEOGRAPHIC": r"\b(countr(y|ies)|cit(y|ies)|regions?|geograph|locations?)",
+    "TEMPORAL": r"\b(trends?|over time|years?|months?|dates?|founded)",
+    "STATISTICAL": r"\b(averages?|medians?|distributions?|how many|counts?|top \d+|most common)\b",
+    "INDUSTRY": r"\bindustr",
+    "DEMOGRAPHIC": r"\bdemograph",
+}
+DATA_PATTERNS = {
+    DataType[name]: re.compile(pattern, re.I)
+    for name, pattern in _DATA_TYPE_KEYWORDS.items()
+    if name in DataType.__members__
+}
+ANALYSIS_PATTERNS = {
+    AnalysisType[name]: re.compile(pattern, re.I)
+    for name, pattern in _ANALYSIS_TYPE_KEYWORDS.items()
+    if name in AnalysisType.__members__
+}
+
+def _normalize(query: str) -> str:
+    """Cache key for a query: lowercased, with whitespace collapsed"""
+    return " ".join(query.lower().split())
+
 class QueryPlanner:
     """
     Analyzes queries and creates efficient execution plans.
     """
     
     def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
+        self.client = _get_client(api_key)
         self.actor_capabilities: Dict[str, ActorCapabilities] = {}
-        self.debug = True
+        # Reverse indices: the first registered actor handling each type
+        self._data_index: Dict[DataType, str] = {}
+        self._analysis_index: Dict[AnalysisType, str] = {}
+        # Formatted capabilities and their hash, rebuilt after registration changes them
+        self._capabilities_cache: Optional[str] = None
+        self._capabilities_key: Optional[str] = None
+        # Enables debug logging of requests and responses (shown when the logger is at DEBUG)
+        self.debug = False
+        # Exact-match tier, keyed on the normalized query, least recently used first
+        self._exact_cache: "OrderedDict[str, Classification]" = OrderedDict()
+        # Semantic tier: per capabilities fingerprint, int8 embeddings and their results
+        self._semantic_cache: Dict[str, Tuple[np.ndarray, List[Classification]]] = self._load_semantic_cache()
         
     def register_actor(self, name: str, capabilities: ActorCapabilities) -> None:
         """Register an actor and its capabilities"""
         self.actor_capabilities[name] = capabilities
-        
-    def _clean_json_response(self, response: str) -> str:
-        """Clean the response to get pure JSON"""
-        # Remove markdown code block if present
-        if '```' in response:
-            # Extract content between ```json and ```
-            match = re.search(r'```(?:json)?(.*?)```', response, re.DOTALL)
-            if match:
-                response = match.group(1)
-        # Remove any leading/trailing whitespace
-        return response.strip()
+        for dt in capabilities.supported_data_types:
+            self._data_index.setdefault(dt, name)
+        for at in capabilities.supported_analyses:
+            self._analysis_index.setdefault(at, name)
+        # Classifications depend on the registered capabilities
+        self._capabilities_cache = None
+        self._capabilities_key = None
+        self._exact_cache.clear()
         
     def _analyze_query_requirements(self, query: str) -> Tuple[List[DataType], List[AnalysisType]]:
         """
         Analyze what data types and analyses are needed for a query.
-        Uses LLM to understand query requirements.
+        Tries the local keyword classifier first, then the exact and semantic caches,
+        and only asks the LLM when nothing matched and nothing is cached.
+        """
+        local = self._classify_local(query)
+        if local is not None:
+            return local
+        
+        data_names, analysis_names = self._classify(_normalize(query))
+        return (
+            [DataType[dt] for dt in data_names],
+            [AnalysisType[at] for at in analysis_names]
+        )
+    
+    def _classify_local(self, query: str) -> Optional[Tuple[List[DataType], List[AnalysisType]]]:
+        """
+        Classify with the keyword patterns, keeping only types a registered actor handles.
+        Returns None unless at least one data type matched (a plan without data has no
+        actors to run), so the LLM path decides instead.
+        """
+        required_data = [
+            dt for dt, pattern in DATA_PATTERNS.items()
+            if dt in self._data_index and pattern.search(query)
+        ]
+        required_analyses = [
+            at for at, pattern in ANALYSIS_PATTERNS.items()
+            if at in self._analysis_index and pattern.search(query)
+        ]
+        if not required_data:
+            return None
+        if self.debug:
+            logger.debug("Classified locally: %s, %s", required_data, required_analyses)
+        return required_data, required_analyses
+    
+    def _load_semantic_cache(self) -> Dict:
+        """Load the semantic cache persisted by earlier runs, starting empty if it can't be read"""
+        try:
+            with open(SEMANTIC_CACHE_PATH, "rb") as f:
+                cache = pickle.load(f)
+        except OSError:
+            return {}
+        except Exception as e:
+            # A truncated or incompatible pickle can fail in many ways; start over rather than crash
+            logger.warning("Ignoring unreadable semantic cache %s: %s", SEMANTIC_CACHE_PATH, e)
+            return {}
+        return cache if isinstance(cache, dict) else {}
+    
+    def _save_semantic_cache(self) -> None:
+        """Persist the semantic cache so later processes can reuse it, written atomically"""
+        SEMANTIC_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = SEMANTIC_CACHE_PATH.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self._semantic_cache, f)
+        os.replace(tmp_path, SEMANTIC_CACHE_PATH)
+    
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        """
+        Unit-normalized embeddings quantized to int8, one row per text, in one request.
+        Returns None if the request fails, so callers skip the semantic tier.
         """
+        try:
+            response = self.client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+        except Exception as e:
+            logger.warning("Embedding failed, skipping the semantic cache: %s", e)
+            return None
+        vecs = np.asarray([item.embedding for item in response.data], dtype=np.float32)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        return np.round(vecs * 127).astype(np.int8)
+    
+    def _classify(self, query_norm: str) -> Classification:
+        """
+        Classify a normalized query through the exact and semantic caches, then the LLM.
+        Only reached when the keyword classifier found nothing, so queries it resolves
+        never pay for an embedding.
+        """
+        result = self._exact_lookup(query_norm)
+        if result is not None:
+            return result
+        
+        vecs = self._embed([query_norm])
+        result = self._semantic_lookup(vecs[0]) if vecs is not None else None
+        if result is None:
+            result = self._classify_uncached(query_norm)
+            if vecs is not None:
+                self._semantic_store(vecs[0], result)
+                self._save_semantic_cache()
+        self._exact_store(query_norm, result)
+        return result
+    
+    def _exact_lookup(self, query_norm: str) -> Optional[Classification]:
+        """Cached classification of exactly this normalized query, if any"""
+        result = self._exact_cache.get(query_norm)
+        if result is not None:
+            self._exact_cache.move_to_end(query_norm)
+        return result
+    
+    def _exact_store(self, query_norm: str, result: Classification) -> None:
+        """Remember a classification, evicting the least recently used beyond EXACT_CACHE_SIZE"""
+        self._exact_cache[query_norm] = result
+        self._exact_cache.move_to_end(query_norm)
+        if len(self._exact_cache) > EXACT_CACHE_SIZE:
+            self._exact_cache.popitem(last=False)
+    
+    def _semantic_lookup(self, vec: np.ndarray) -> Optional[Classification]:
+        """Classification of the most similar cached query, if it clears SEMANTIC_CACHE_THRESHOLD"""
+        vectors, results = self._semantic_cache.get(self._get_capabilities_key(), (None, []))
+        if vectors is None:
+            return None
+        # Cosine similarity against every cached vector at once (both sides are unit length)
+        similarities = vectors.astype(np.float32) @ vec.astype(np.float32) / (127 * 127)
+        best = int(np.argmax(similarities))
+        if similarities[best] < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        if self.debug:
+            logger.debug("Semantic cache hit (similarity %.3f)", similarities[best])
+        return results[best]
+    
+    def _semantic_store(self, vec: np.ndarray, result: Classification) -> None:
+        """
+        Add a classification to the semantic tier, dropping the oldest beyond SEMANTIC_CACHE_SIZE;
+        callers persist it with _save_semantic_cache
+        """
+        capabilities_key = self._get_capabilities_key()
+        vectors, results = self._semantic_cache.get(capabilities_key, (None, []))
+        vectors = vec[None, :] if vectors is None else np.vstack([vectors, vec])
+        results = results + [result]
+        self._semantic_cache[capabilities_key] = (vectors[-SEMANTIC_CACHE_SIZE:], results[-SEMANTIC_CACHE_SIZE:])
+    
+    def _classify_uncached(self, query: str) -> Classification:
+        """Ask the LLM which data types and analyses a query needs, as enum names"""
         capabilities_desc = self._format_capabilities_for_prompt()
         
         data_types = [dt.name for dt in DataType]
@@ -66,67 +267,121 @@ Use only the valid types listed above."""
         ]
 
         if self.debug:
-            print("\nSending request to OpenAI with messages:")
-            print(json.dumps(messages, indent=2))
+            logger.debug("Sending request to OpenAI: %s", messages)
             
         response = self.client.chat.completions.create(
             model="gpt-4-1106-preview",
             messages=messages,
-            temperature=0
+            temperature=0,
+            # JSON mode guarantees a bare JSON object, with no markdown fences to strip
+            response_format={"type": "json_object"}
         )
         
+        content = response.choices[0].message.content
         if self.debug:
-            print("\nReceived response from OpenAI:")
-            print(response.choices[0].message.content)
+            logger.debug("Received response from OpenAI: %s", content)
             
         try:
-            # Clean the response content
-            cleaned_content = self._clean_json_response(response.choices[0].message.content)
-            
-            if self.debug:
-                print("\nCleaned JSON content:")
-                print(cleaned_content)
-            
-            result = json.loads(cleaned_content)
-            
-            # Validate response format
-            if not isinstance(result, dict):
-                raise ValueError("Response is not a dictionary")
-            if "required_data_types" not in result or "required_analyses" not in result:
-                raise ValueError("Response missing required keys")
-            if not all(dt in data_types for dt in result["required_data_types"]):
-                raise ValueError("Invalid data types in response")
-            if not all(at in analysis_types for at in result["required_analyses"]):
-                raise ValueError("Invalid analysis types in response")
-            
-            return (
-                [DataType[dt] for dt in result["required_data_types"]],
-                [AnalysisType[at] for at in result["required_analyses"]]
-            )
+            result = json.loads(content)
+            return self._validate_requirements(result, data_types, analysis_types)
             
         except json.JSONDecodeError as e:
-            print(f"\nJSON Parse Error: {e}")
-            print("Response content:", response.choices[0].message.content)
-            print("Cleaned content:", cleaned_content)
+            logger.error("JSON parse error: %s; response content: %s", e, content)
             raise ValueError(f"Failed to parse LLM response: {e}")
         except Exception as e:
-            print(f"\nValidation Error: {e}")
-            print("Parsed result:", result)
+            logger.error("Validation error: %s; response content: %s", e, content)
             raise ValueError(f"Invalid response format: {e}")
 
+    def _validate_requirements(
+        self, result, data_types: List[str], analysis_types: List[str]
+    ) -> Classification:
+        """Check one parsed classification and return it as tuples of enum names"""
+        if not isinstance(result, dict):
+            raise ValueError("Response is not a dictionary")
+        if "required_data_types" not in result or "required_analyses" not in result:
+            raise ValueError("Response missing required keys")
+        if not all(dt in data_types for dt in result["required_data_types"]):
+            raise ValueError("Invalid data types in response")
+        if not all(at in analysis_types for at in result["required_analyses"]):
+            raise ValueError("Invalid analysis types in response")
+        
+        return (
+            tuple(result["required_data_types"]),
+            tuple(result["required_analyses"])
+        )
+    
+    def _classify_batch(self, queries: List[str]) -> List[Classification]:
+        """Classify several queries with a single LLM request, in input order"""
+        capabilities_desc = self._format_capabilities_for_prompt()
+        
+        data_types = [dt.name for dt in DataType]
+        analysis_types = [at.name for at in AnalysisType]
+        numbered = "\n".join(f'{i}. "{query}"' for i, query in enumerate(queries, 1))
+        
+        messages = [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that analyzes queries to determine required data types and analyses. Respond with a JSON object whose results array holds one object with required_data_types and required_analyses arrays per query, in order."
+            },
+            {
+                "role": "user",
+                "content": f"""Analyze each of these {len(queries)} queries:
+{numbered}
+
+Available capabilities:
+{capabilities_desc}
+
+Valid data types: {data_types}
+Valid analysis types: {analysis_types}
+
+Return a JSON object whose results array has one entry per query, in the same order:
+{{"results": [{{"required_data_types": ["CUSTOMER"], "required_analyses": ["GEOGRAPHIC"]}}]}}
+
+Use only the valid types listed above."""
+            }
+        ]
+        
+        if self.debug:
+            logger.debug("Sending batch of %d queries to OpenAI", len(queries))
+            
+        response = self.client.chat.completions.create(
+            model="gpt-4-1106-preview",
+            messages=messages,
+            temperature=0,
+            # JSON mode guarantees a bare JSON object, with no markdown fences to strip
+            response_format={"type": "json_object"}
+        )
+        
+        try:
+            results = json.loads(response.choices[0].message.content).get("results")
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.error("Could not parse batch response: %s", response.choices[0].message.content)
+            raise ValueError(f"Failed to parse LLM response: {e}")
+        if not isinstance(results, list) or len(results) != len(queries):
+            raise ValueError(f"Expected a results array of {len(queries)} entries")
+        return [self._validate_requirements(result, data_types, analysis_types) for result in results]
+
     def _format_capabilities_for_prompt(self) -> str:
-        """Format all actor capabilities into a string for prompts"""
-        output = []
-        for actor_name, caps in self.actor_capabilities.items():
-            output.append(f"Actor: {actor_name}")
-            output.append("Data Types:")
-            for dt in caps.supported_data_types:
-                output.append(f"- {dt.name}")
-            output.append("Analyses:")
-            for at in caps.supported_analyses:
-                output.append(f"- {at.name}")
-            output.append("")
-        return "\n".join(output)
+        """Format all actor capabilities into a string for prompts, cached until the next registration"""
+        if self._capabilities_cache is None:
+            self._capabilities_cache = "\n".join(
+                "\n".join([
+                    f"Actor: {actor_name}",
+                    "Data Types:",
+                    *(f"- {dt.name}" for dt in caps.supported_data_types),
+                    "Analyses:",
+                    *(f"- {at.name}" for at in caps.supported_analyses),
+                    ""
+                ])
+                for actor_name, caps in self.actor_capabilities.items()
+            )
+        return self._capabilities_cache
+    
+    def _get_capabilities_key(self) -> str:
+        """Hash of the formatted capabilities, partitioning the semantic cache"""
+        if self._capabilities_key is None:
+            self._capabilities_key = hashlib.sha256(self._format_capabilities_for_prompt().encode()).hexdigest()
+        return self._capabilities_key
     
         
     def _create_execution_steps(
@@ -151,20 +406,19 @@ Use only the valid types listed above."""
             steps.append(step)
             handled_data.add(data_type)
             
+        # Every step so far retrieves data, and each analysis depends on all of them
+        retrieval_actors = list(dict.fromkeys(s.actor_name for s in steps))
+        
         # Then, handle analyses
         for analysis in required_analyses:
             # Find actor that can do this analysis
             actor = self._find_best_actor_for_analysis(analysis)
-            dependencies = [
-                s.actor_name for s in steps
-                if any(dt in s.required_data for dt in handled_data)
-            ]
             step = ExecutionStep(
                 actor_name=actor,
                 action=f"perform_{analysis.name.lower()}_analysis",
                 required_data=list(handled_data),
                 expected_output=f"{analysis.name} analysis results",
-                depends_on=dependencies
+                depends_on=retrieval_actors
             )
             steps.append(step)
             
@@ -172,17 +426,17 @@ Use only the valid types listed above."""
         
     def _find_best_actor_for_data(self, data_type: DataType) -> str:
         """Find the most suitable actor for handling a data type"""
-        for name, caps in self.actor_capabilities.items():
-            if data_type in caps.supported_data_types:
-                return name
-        raise ValueError(f"No actor found for data type: {data_type}")
+        try:
+            return self._data_index[data_type]
+        except KeyError:
+            raise ValueError(f"No actor found for data type: {data_type}") from None
         
     def _find_best_actor_for_analysis(self, analysis_type: AnalysisType) -> str:
         """Find the most suitable actor for an analysis type"""
-        for name, caps in self.actor_capabilities.items():
-            if analysis_type in caps.supported_analyses:
-                return name
-        raise ValueError(f"No actor found for analysis: {analysis_type}")
+        try:
+            return self._analysis_index[analysis_type]
+        except KeyError:
+            raise ValueError(f"No actor found for analysis: {analysis_type}") from None
         
     def create_execution_plan(self, query: str) -> ExecutionPlan:
         """
@@ -194,6 +448,62 @@ Use only the valid types listed above."""
         # Analyze query requirements
         required_data, required_analyses = self._analyze_query_requirements(query)
         
+        return self._build_plan(query, required_data, required_analyses, metrics)
+    
+    def create_execution_plans(self, queries: List[str]) -> List[ExecutionPlan]:
+        """
+        Create execution plans for many queries at once.
+        Queries the keyword classifier can't resolve go through the exact and semantic
+        caches (embedded in one request); the rest are classified together, in batches
+        of up to BATCH_SIZE per LLM request, and written back to both caches.
+        """
+        metrics = [ExecutionMetrics(start_time=datetime.now()) for _ in queries]
+        requirements: List[Optional[Tuple[List[DataType], List[AnalysisType]]]] = [
+            self._classify_local(query) for query in queries
+        ]
+        
+        pending = [i for i, found in enumerate(requirements) if found is None]
+        norms = {i: _normalize(queries[i]) for i in pending}
+        classified: Dict[int, Optional[Classification]] = {i: self._exact_lookup(norms[i]) for i in pending}
+        
+        unseen = [i for i in pending if classified[i] is None]
+        embedded = self._embed([norms[i] for i in unseen]) if unseen else None
+        vecs = dict(zip(unseen, embedded)) if embedded is not None else {}
+        for i in vecs:
+            classified[i] = self._semantic_lookup(vecs[i])
+        
+        misses = [i for i in unseen if classified[i] is None]
+        for start in range(0, len(misses), BATCH_SIZE):
+            batch = misses[start:start + BATCH_SIZE]
+            for i, result in zip(batch, self._classify_batch([queries[i] for i in batch])):
+                if i in vecs:
+                    self._semantic_store(vecs[i], result)
+                classified[i] = result
+        if misses and vecs:
+            self._save_semantic_cache()
+        
+        for i in pending:
+            self._exact_store(norms[i], classified[i])
+            data_names, analysis_names = classified[i]
+            requirements[i] = (
+                [DataType[dt] for dt in data_names],
+                [AnalysisType[at] for at in analysis_names]
+            )
+        
+        return [
+            self._build_plan(query, required_data, required_analyses, plan_metrics)
+            for query, (required_data, required_analyses), plan_metrics
+            in zip(queries, requirements, metrics)
+        ]
+    
+    def _build_plan(
+        self,
+        query: str,
+        required_data: List[DataType],
+        required_analyses: List[AnalysisType],
+        metrics: ExecutionMetrics
+    ) -> ExecutionPlan:
+        """Turn classified requirements into an execution plan"""
         # Create execution steps
         steps = self._create_execution_steps(required_data, required_analyses)
         
@@ -201,7 +511,7 @@ Use only the valid types listed above."""
         synthesis_prompt = self._create_synthesis_prompt(query, steps)
         
         # Get unique actors needed
-        required_actors = list(set(step.actor_name for step in steps))
+        required_actors = list(dict.fromkeys(step.actor_name for step in steps))
         
         return ExecutionPlan(
             query=query,